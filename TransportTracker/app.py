@@ -1,123 +1,192 @@
 import os
-import json
+import hmac
 import logging
-from datetime import datetime, date
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+import click
+from datetime import datetime, date, timedelta
+from flask import Flask, Blueprint, Response, current_app, stream_with_context, make_response, render_template, request, redirect, url_for, flash, jsonify
+from flask.cli import with_appcontext
+from flask_login import LoginManager, login_url, login_user, logout_user, login_required, current_user
 from functools import wraps
-from models import db, User, Emission
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
-
-# Database configuration - SQLite for cross-platform compatibility
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///carbon_tracker.db")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
-    # Only use these options for PostgreSQL
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_pre_ping': True,
-        "pool_recycle": 300,
-    }
+from models import db, User
+from eco_facts import EcoFactsProvider
+from factors import FactorRegistry
+from emission_store import upsert_emissions, upsert_emission, ensure_unique_day_index, ensure_added_columns, migrate_appliance_usage
+from reports import appliance_hours_by_month
+from recompute import recompute_emissions
+from rollups import refresh_rollups, rebuild_rollups
+from history_engine import get_summary, get_chart_window, get_page, parse_cursor
+from metrics import init_metrics, timed
+from exports import generate_csv, generate_ndjson
+from passwords import PasswordPoolBusy, init_password_hashing
+from user_cache import load_identity, user_cache
+from trends import TRENDS_DEFAULT_DAYS, get_trends, trends_cache
+from cohorts import cohort_percentiles
+from legacy_import import import_legacy_emissions
+from http_cache import reference_response, page_etag, page_not_modified, private_cache
+from sqlite_profile import configure_sqlite, init_sqlite_profile
+from replicas import configure_replicas, read_replica, replica_reads
+from assets import build_assets, init_assets
+from archive import archive_emissions, ensure_archive, init_archive
+from validation import NUMBER_RULE, input_number
 
-# Initialize database
-db.init_app(app)
+# Configure logging (set LOG_LEVEL=DEBUG for verbose output)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 # Initialize Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'signin'
+login_manager.login_view = 'main.signin'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Create database tables
-with app.app_context():
-    db.create_all()
-
-# Emission factors (kg CO2 per unit)
-EMISSION_FACTORS = {
-    'transportation': {
-        'Car': {'Petrol': 0.24, 'Diesel': 0.27, 'CNG': 0.18, 'Electric': 0.05},
-        'Bike': {'Petrol': 0.08, 'Electric': 0.02},
-        'Bus': {'Diesel': 0.10, 'CNG': 0.08, 'Electric': 0.04},
-        'Train': {'Electric': 0.04, 'Diesel': 0.06},
-        'Plane': {'Jet Fuel': 0.25},
-        'Walking': {'None': 0.0}
-    },
-    'appliances': {
-        'AC': 1.5,  # kWh per hour
-        'Fan': 0.05,
-        'Fridge': 0.15,
-        'Washing Machine': 0.5,
-        'Heater': 2.0,
-        'TV': 0.1
-    },
-    'electricity': 0.5,  # kg CO2 per kWh
-    'diet': {
-        'Chicken': 0.6,  # kg CO2 per 100g
-        'Beef': 2.7,
-        'Pork': 1.2,
-        'Fish': 0.5,
-        'Mutton': 2.4,
-        'Vegetarian': 0.1
-    },
-    'gas': 2.98,  # kg CO2 per kg LPG
-    'waste': {
-        'recycled': 0.1,  # kg CO2 per kg waste
-        'not_recycled': 0.5
-    },
-    'water': 0.0003  # kg CO2 per liter
-}
-
-def load_data():
-    """Load emissions data from JSON file"""
-    try:
-        with open('data/emissions.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    # Served from the per-process identity cache; routes needing the ORM row call get_user()
+    return load_identity(int(user_id))
 
-def save_data(data):
-    """Save emissions data to JSON file"""
-    os.makedirs('data', exist_ok=True)
-    with open('data/emissions.json', 'w') as f:
-        json.dump(data, f, indent=2, default=str)
+@login_manager.unauthorized_handler
+def unauthorized():
+    # API clients get a JSON 401 instead of being redirected to the sign-in page
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Authentication required'}), 401
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, next_url=request.url))
 
-def load_eco_facts():
-    """Load eco facts from JSON file"""
-    try:
-        with open('data/eco_facts.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Return default facts if file doesn't exist
-        default_facts = [
-            "A single tree can absorb 22 kg of CO₂ per year.",
-            "Walking or cycling for short trips can reduce your carbon footprint by up to 50%.",
-            "LED bulbs use 75% less energy than incandescent bulbs.",
-            "Recycling one aluminum can saves enough energy to power a TV for 3 hours.",
-            "Eating less meat one day per week can save 1,900 pounds of CO₂ per year.",
-            "Taking shorter showers can save up to 150 gallons of water per month.",
-            "Unplugging electronics when not in use can reduce energy consumption by 10%.",
-            "Using public transport instead of driving can reduce CO₂ emissions by 45%."
-        ]
-        save_eco_facts(default_facts)
-        return default_facts
+# All application routes are registered on this blueprint by create_app()
+bp = Blueprint('main', __name__)
+
+# Eco facts are loaded once per process and kept in memory
+ECO_FACTS_FILE = 'data/eco_facts.json'
+eco_facts = EcoFactsProvider(ECO_FACTS_FILE)
+
+# Versioned emission factors (kg CO2 per unit); edits to the file are picked up
+# by running workers without a restart once its version is raised
+EMISSION_FACTORS_FILE = 'data/emission_factors.json'
+emission_factors = FactorRegistry(EMISSION_FACTORS_FILE)
 
-def save_eco_facts(facts):
-    """Save eco facts to JSON file"""
-    os.makedirs('data', exist_ok=True)
-    with open('data/eco_facts.json', 'w') as f:
-        json.dump(facts, f, indent=2)
+def create_app(config=None):
+    """Create and configure the Flask application
+
+    `config` is an optional mapping that overrides the environment-based defaults.
+    The database schema is not touched here; run `flask init-db` to create it.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
+    
+    # Database configuration - SQLite for cross-platform compatibility
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///carbon_tracker.db")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Optional comma-separated read replicas for history, export and analytics reads.
+    # A client that wrote keeps reading from the primary for REPLICA_STICKY_SECONDS.
+    app.config['DATABASE_REPLICA_URLS'] = os.environ.get("DATABASE_REPLICA_URLS", "")
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.environ.get("REPLICA_STICKY_SECONDS", 30))
+    
+    # Token for machine-to-machine endpoints such as bulk ingest (disabled when unset)
+    app.config['BULK_API_TOKEN'] = os.environ.get("BULK_API_TOKEN")
+    
+    # Request/SQL/template instrumentation exposed on /metrics
+    app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "true").lower() in ('1', 'true', 'yes')
+    
+    # Password hashing: method is 'scrypt', 'bcrypt' or any werkzeug method such as
+    # 'pbkdf2:sha256:600000'. Existing hashes are upgraded on the user's next login.
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config['PASSWORD_BCRYPT_ROUNDS'] = int(os.environ.get("PASSWORD_BCRYPT_ROUNDS", 12))
+    
+    # Optional bounded pool ('thread' or 'process') for hashing outside the request thread
+    app.config['PASSWORD_POOL_WORKERS'] = int(os.environ.get("PASSWORD_POOL_WORKERS", 0))
+    app.config['PASSWORD_POOL_KIND'] = os.environ.get("PASSWORD_POOL_KIND", "thread")
+    
+    # Per-process cache of signed-in user identities (TTL of 0 disables it)
+    app.config['USER_CACHE_TTL'] = float(os.environ.get("USER_CACHE_TTL", 300))
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get("USER_CACHE_SIZE", 1024))
+    
+    # Per-process cache of /api/trends results, reused while the user's rollups are unchanged
+    app.config['TRENDS_CACHE_TTL'] = float(os.environ.get("TRENDS_CACHE_TTL", 300))
+    app.config['TRENDS_CACHE_SIZE'] = int(os.environ.get("TRENDS_CACHE_SIZE", 1024))
+    
+    # SQLite deployment profile: 'production' sets WAL journaling, synchronous=NORMAL,
+    # the busy timeout (ms), mmap size (bytes) and page cache (negative = KiB) on every
+    # connection; 'default' leaves SQLite's own settings
+    app.config['SQLITE_PROFILE'] = os.environ.get("SQLITE_PROFILE", "production")
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024))
+    
+    # Emission rows older than this many days are moved to the archive by `flask archive-emissions`.
+    # On SQLite the archive is a separate file, by default name-archive.db next to the database.
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get("ARCHIVE_AFTER_DAYS", 730))
+    app.config['ARCHIVE_DATABASE_PATH'] = os.environ.get("ARCHIVE_DATABASE_PATH")
+    
+    if config:
+        app.config.update(config)
+    
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # Only use these options for PostgreSQL
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_pre_ping': True,
+            "pool_recycle": 300,
+        })
+    else:
+        configure_sqlite(app)
+    configure_replicas(app)
+    
+    # Initialize database
+    db.init_app(app)
+    init_sqlite_profile(app)
+    init_archive(app)
+    
+    # Initialize Flask-Login
+    login_manager.init_app(app)
+    init_password_hashing(app)
+    user_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    trends_cache.configure(app.config['TRENDS_CACHE_SIZE'], app.config['TRENDS_CACHE_TTL'])
+    
+    app.register_blueprint(bp)
+    init_assets(app)
+    init_metrics(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(import_legacy_command)
+    app.cli.add_command(migrate_appliances_command)
+    app.cli.add_command(appliance_report_command)
+    app.cli.add_command(recompute_emissions_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(archive_emissions_command)
+    
+    eco_facts.load()
+    emission_factors.load()
+    
+    return app
 
-def calculate_transportation_emissions(transport_data):
+def init_db():
+    """Create database tables and indexes that do not exist yet
+
+    Only the primary is changed; replicas receive the schema through replication.
+    """
+    db.create_all(bind_key=None)
+    ensure_unique_day_index()
+    ensure_added_columns()
+    ensure_archive()
+
+def get_factor_tables():
+    """Return the batch lookup tables of the current factor set, building them on first use"""
+    return emission_factors.current().tables
+
+def api_token_required(f):
+    """Require the bulk API token as a bearer token"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = current_app.config.get('BULK_API_TOKEN')
+        provided = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not token or not hmac.compare_digest(provided, token):
+            return jsonify({'error': 'Invalid or missing API token'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+@timed
+def calculate_transportation_emissions(transport_data, factors=None):
     """Calculate CO2 emissions from transportation"""
+    factors = factors or emission_factors.current().factors
     total_emissions = 0
     
     for transport in transport_data:
@@ -125,45 +194,204 @@ def calculate_transportation_emissions(transport_data):
         fuel = transport.get('fuel')
         distance = float(transport.get('distance', 0))
         
-        if vehicle in EMISSION_FACTORS['transportation']:
-            if fuel in EMISSION_FACTORS['transportation'][vehicle]:
-                factor = EMISSION_FACTORS['transportation'][vehicle][fuel]
+        if vehicle in factors['transportation']:
+            if fuel in factors['transportation'][vehicle]:
+                factor = factors['transportation'][vehicle][fuel]
                 total_emissions += distance * factor
     
     return total_emissions
 
-def calculate_electricity_emissions(appliances_data):
+@timed
+def calculate_electricity_emissions(appliances_data, factors=None):
     """Calculate CO2 emissions from electricity usage"""
+    factors = factors or emission_factors.current().factors
     total_kwh = 0
     
     for appliance_data in appliances_data:
         appliance = appliance_data.get('appliance')
         hours = float(appliance_data.get('hours', 0))
         
-        if appliance in EMISSION_FACTORS['appliances']:
-            kwh_per_hour = EMISSION_FACTORS['appliances'][appliance]
+        if appliance in factors['appliances']:
+            kwh_per_hour = factors['appliances'][appliance]
             total_kwh += hours * kwh_per_hour
     
-    return total_kwh * EMISSION_FACTORS['electricity']
+    return total_kwh * factors['electricity']
 
-def calculate_diet_emissions(diet_data):
+@timed
+def calculate_diet_emissions(diet_data, factors=None):
     """Calculate CO2 emissions from diet"""
+    factors = factors or emission_factors.current().factors
     diet_type = diet_data.get('type')
     frequency = float(diet_data.get('frequency', 0))
     
     if diet_type == 'Vegetarian':
-        return frequency * EMISSION_FACTORS['diet']['Vegetarian'] * 7  # per week
+        return frequency * factors['diet']['Vegetarian'] * 7  # per week
     
     total_emissions = 0
     meat_types = diet_data.get('meat_types', [])
     
     for meat in meat_types:
-        if meat in EMISSION_FACTORS['diet']:
+        if meat in factors['diet']:
             # Assume 100g serving per meal
-            total_emissions += frequency * EMISSION_FACTORS['diet'][meat]
+            total_emissions += frequency * factors['diet'][meat]
     
     return total_emissions
 
+def calculate_breakdown(transport_data, appliances_data, diet_data, gas_usage, waste_amount, recycles, water_usage,
+                        factors=None):
+    """Calculate the per-category emissions breakdown, rounded to 2 decimals
+
+    All categories use the same factor set: `factors`, or the current one when omitted.
+    """
+    factors = factors or emission_factors.current().factors
+    transportation_emissions = calculate_transportation_emissions(transport_data, factors)
+    electricity_emissions = calculate_electricity_emissions(appliances_data, factors)
+    diet_emissions = calculate_diet_emissions(diet_data, factors)
+    gas_emissions = gas_usage * factors['gas']
+    waste_emissions = waste_amount * (factors['waste']['recycled'] if recycles else factors['waste']['not_recycled'])
+    water_emissions = water_usage * factors['water']
+    
+    return {
+        'transportation': round(transportation_emissions, 2),
+        'electricity': round(electricity_emissions, 2),
+        'diet': round(diet_emissions, 2),
+        'gas': round(gas_emissions, 2),
+        'waste': round(waste_emissions, 2),
+        'water': round(water_emissions, 2)
+    }
+
+def save_daily_emission(user_id, day, breakdown, total_emissions, transport_data, appliances_data, diet_data,
+                        gas_usage, waste_amount, recycles, water_usage, factor_version=None):
+    """Insert or update a user's entry for the day and refresh its rollups (caller commits)
+
+    The raw inputs are stored alongside the totals so they can be recomputed when factors change.
+    """
+    upsert_emission({
+        'user_id': user_id,
+        'date': day,
+        'transport_total': breakdown['transportation'],
+        'electricity_total': breakdown['electricity'],
+        'diet_total': breakdown['diet'],
+        'gas_total': breakdown['gas'],
+        'waste_total': breakdown['waste'],
+        'water_total': breakdown['water'],
+        'total_emissions': round(total_emissions, 2),
+        'factor_version': factor_version,
+        'transport_legs': transport_data,
+        'appliance_usage': appliances_data,
+        'diet_type': diet_data.get('type'),
+        'diet_frequency': float(diet_data.get('frequency') or 0),
+        'meat_types': list(diet_data.get('meat_types') or []),
+        'gas_usage': gas_usage,
+        'waste_amount': waste_amount,
+        'waste_recycled': recycles,
+        'water_usage': water_usage
+    })
+    refresh_rollups([(user_id, day)])
+
+# Diet types accepted by the tracking form and API
+DIET_TYPES = ('Vegetarian', 'Non-Vegetarian')
+
+def _api_number(value, field, errors):
+    """Validate a numeric API input with input_number(), recording an error if invalid"""
+    number = input_number(value)
+    if number is None:
+        errors.append(f"{field} {NUMBER_RULE}")
+        return 0.0
+    return number
+
+def _api_bool(value, field, errors):
+    """Validate an optional boolean API input, recording an error unless it is a JSON boolean"""
+    if value is None:
+        return False
+    if not isinstance(value, bool):
+        errors.append(f"{field} must be true or false")
+        return False
+    return value
+
+def _api_list(value, field, errors):
+    """Validate an optional API list input, recording an error if it is not a list"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        errors.append(f"{field} must be a list")
+        return []
+    return value
+
+def _api_key(value):
+    """Return a factor-table lookup key, or None for values that cannot be one"""
+    return value if isinstance(value, str) else None
+
+def parse_calculation_payload(payload, factors):
+    """Validate a JSON calculation payload against a factor set in a single pass
+
+    Returns (inputs, errors), where inputs holds the same structures the form
+    path passes to the calculation functions.
+    """
+    errors = []
+    if not isinstance(payload, dict):
+        return None, ['Request body must be a JSON object']
+    
+    try:
+        day = datetime.strptime(payload['date'], '%Y-%m-%d').date() if payload.get('date') else date.today()
+    except (TypeError, ValueError):
+        errors.append('date must be formatted as YYYY-MM-DD')
+        day = None
+    
+    transport_data = []
+    for i, leg in enumerate(_api_list(payload.get('transport'), 'transport', errors)):
+        vehicle, fuel = (leg.get('vehicle'), leg.get('fuel')) if isinstance(leg, dict) else (None, None)
+        if _api_key(fuel) not in factors['transportation'].get(_api_key(vehicle), {}):
+            errors.append(f"transport[{i}]: unknown vehicle/fuel combination {vehicle}/{fuel}")
+            continue
+        transport_data.append({
+            'vehicle': vehicle,
+            'fuel': fuel,
+            'distance': _api_number(leg.get('distance'), f"transport[{i}].distance", errors)
+        })
+    
+    appliances_data = []
+    for i, item in enumerate(_api_list(payload.get('appliances'), 'appliances', errors)):
+        appliance = item.get('appliance') if isinstance(item, dict) else None
+        if _api_key(appliance) not in factors['appliances']:
+            errors.append(f"appliances[{i}]: unknown appliance {appliance}")
+            continue
+        appliances_data.append({
+            'appliance': appliance,
+            'hours': _api_number(item.get('hours'), f"appliances[{i}].hours", errors)
+        })
+    
+    diet = payload.get('diet') or {}
+    if not isinstance(diet, dict):
+        errors.append('diet must be an object')
+        diet = {}
+    diet_type = diet.get('type', 'Vegetarian')
+    if _api_key(diet_type) not in DIET_TYPES:
+        errors.append(f"diet.type must be one of {', '.join(DIET_TYPES)}")
+    meat_types = _api_list(diet.get('meat_types'), 'diet.meat_types', errors)
+    unknown_meats = [meat for meat in meat_types if _api_key(meat) not in factors['diet']]
+    if unknown_meats:
+        errors.append(f"diet.meat_types: unknown values {', '.join(map(str, unknown_meats))}")
+    diet_data = {
+        'type': diet_type,
+        'frequency': _api_number(diet.get('frequency'), 'diet.frequency', errors),
+        'meat_types': meat_types
+    }
+    
+    inputs = {
+        'date': day,
+        'transport_data': transport_data,
+        'appliances_data': appliances_data,
+        'diet_data': diet_data,
+        'gas_usage': _api_number(payload.get('gas_usage'), 'gas_usage', errors),
+        'waste_amount': _api_number(payload.get('waste_amount'), 'waste_amount', errors),
+        'recycles': _api_bool(payload.get('recycles'), 'recycles', errors),
+        'water_usage': _api_number(payload.get('water_usage'), 'water_usage', errors),
+        'dry_run': _api_bool(payload.get('dry_run'), 'dry_run', errors)
+    }
+    return inputs, errors
+
+@timed
 def generate_suggestions(breakdown):
     """Generate personalized suggestions based on emissions breakdown"""
     suggestions = []
@@ -201,25 +429,35 @@ def generate_suggestions(breakdown):
     
     return suggestions[:3]  # Return max 3 suggestions
 
-@app.route('/signin', methods=['GET', 'POST'])
+@bp.route('/signin', methods=['GET', 'POST'])
 def signin():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            authenticated = bool(user and user.check_password(password))
+            
+            # Upgrade hashes made with older parameters while we have the plain password
+            if authenticated and user.rehash_password_if_needed(password):
+                db.session.commit()
+        except PasswordPoolBusy:
+            flash('Too many sign-in attempts right now. Please try again in a moment.', 'error')
+            return render_template('signin.html'), 503
+        
+        if authenticated:
             remember_me = bool(request.form.get('remember_me'))
             login_user(user, remember=remember_me)
             flash('Welcome back!', 'success')
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('root'))
+            return redirect(next_page) if next_page else redirect(url_for('main.root'))
         else:
             flash('Invalid username or password', 'error')
     
     return render_template('signin.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -244,7 +482,11 @@ def signup():
                 # Log in the new user
                 login_user(new_user)
                 flash('Account created successfully! Welcome to EcoTracker!', 'success')
-                return redirect(url_for('root'))
+                return redirect(url_for('main.root'))
+            except PasswordPoolBusy:
+                db.session.rollback()
+                flash('Too many sign-ups right now. Please try again in a moment.', 'error')
+                return render_template('signup.html'), 503
             except Exception as e:
                 db.session.rollback()
                 flash('An error occurred while creating your account. Please try again.', 'error')
@@ -252,25 +494,25 @@ def signup():
     
     return render_template('signup.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('signin'))
+    return redirect(url_for('main.signin'))
 
-@app.route('/')
+@bp.route('/')
 def root():
     if current_user.is_authenticated:
-        return render_template('index.html', today=date.today())
+        return render_template('index.html', today=date.today(), factor_version=emission_factors.current().version)
     else:
-        return redirect(url_for('signin'))
+        return redirect(url_for('main.signin'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def index():
-    return render_template('index.html', today=date.today())
+    return render_template('index.html', today=date.today(), factor_version=emission_factors.current().version)
 
-@app.route('/calculate', methods=['POST'])
+@bp.route('/calculate', methods=['POST'])
 @login_required
 def calculate():
     try:
@@ -327,79 +569,23 @@ def calculate():
         recycles = request.form.get('recycles') == 'yes'
         water_usage = float(request.form.get('water_usage', 0))
         
-        # Calculate emissions
-        transportation_emissions = calculate_transportation_emissions(transport_data)
-        electricity_emissions = calculate_electricity_emissions(appliances_data)
-        diet_emissions = calculate_diet_emissions(diet_data)
-        gas_emissions = gas_usage * EMISSION_FACTORS['gas']
-        waste_emissions = waste_amount * (EMISSION_FACTORS['waste']['recycled'] if recycles else EMISSION_FACTORS['waste']['not_recycled'])
-        water_emissions = water_usage * EMISSION_FACTORS['water']
-        
-        # Create breakdown
-        breakdown = {
-            'transportation': round(transportation_emissions, 2),
-            'electricity': round(electricity_emissions, 2),
-            'diet': round(diet_emissions, 2),
-            'gas': round(gas_emissions, 2),
-            'waste': round(waste_emissions, 2),
-            'water': round(water_emissions, 2)
-        }
-        
+        # Calculate emissions with a single factor set, recorded on the saved row
+        factor_set = emission_factors.current()
+        breakdown = calculate_breakdown(transport_data, appliances_data, diet_data,
+                                        gas_usage, waste_amount, recycles, water_usage, factor_set.factors)
         total_emissions = sum(breakdown.values())
         
         # Generate suggestions
         suggestions = generate_suggestions(breakdown)
         
         # Get random eco fact
-        eco_facts = load_eco_facts()
-        import random
-        eco_fact = random.choice(eco_facts)
+        eco_fact = eco_facts.random_fact()
         
         # Save data to database
-        from datetime import datetime
         selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        
-        # Check if entry for this date already exists for this user
-        existing_emission = Emission.query.filter_by(
-            user_id=user.id, 
-            date=selected_date_obj
-        ).first()
-        
-        if existing_emission:
-            # Update existing entry
-            existing_emission.transport_total = round(transportation_emissions, 2)
-            existing_emission.electricity_total = round(electricity_emissions, 2)
-            existing_emission.diet_total = round(diet_emissions, 2)
-            existing_emission.gas_total = round(gas_emissions, 2)
-            existing_emission.waste_total = round(waste_emissions, 2)
-            existing_emission.water_total = round(water_emissions, 2)
-            existing_emission.total_emissions = round(total_emissions, 2)
-            existing_emission.appliance_usage = appliances_data
-            existing_emission.diet_type = diet_type
-            existing_emission.gas_usage = gas_usage
-            existing_emission.waste_amount = waste_amount
-            existing_emission.waste_recycled = recycles
-            existing_emission.water_usage = water_usage
-        else:
-            # Create new entry
-            new_emission = Emission()
-            new_emission.user_id = user.id
-            new_emission.date = selected_date_obj
-            new_emission.transport_total = round(transportation_emissions, 2)
-            new_emission.electricity_total = round(electricity_emissions, 2)
-            new_emission.diet_total = round(diet_emissions, 2)
-            new_emission.gas_total = round(gas_emissions, 2)
-            new_emission.waste_total = round(waste_emissions, 2)
-            new_emission.water_total = round(water_emissions, 2)
-            new_emission.total_emissions = round(total_emissions, 2)
-            new_emission.appliance_usage = appliances_data
-            new_emission.diet_type = diet_type
-            new_emission.gas_usage = gas_usage
-            new_emission.waste_amount = waste_amount
-            new_emission.waste_recycled = recycles
-            new_emission.water_usage = water_usage
-            db.session.add(new_emission)
-        
+        save_daily_emission(user.id, selected_date_obj, breakdown, total_emissions, transport_data,
+                            appliances_data, diet_data, gas_usage, waste_amount, recycles, water_usage,
+                            factor_set.version)
         db.session.commit()
         
         return render_template('result.html', 
@@ -411,17 +597,52 @@ def calculate():
     except Exception as e:
         logging.error(f"Error in calculate route: {str(e)}")
         flash(f"An error occurred while calculating emissions: {str(e)}", 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-@app.route('/history')
+@bp.route('/api/calculate', methods=['POST'])
 @login_required
+def api_calculate():
+    """API endpoint to calculate (and optionally save) a day's emissions from JSON"""
+    factor_set = emission_factors.current()
+    inputs, errors = parse_calculation_payload(request.get_json(silent=True), factor_set.factors)
+    if errors:
+        return jsonify({'errors': errors}), 400
+    
+    breakdown = calculate_breakdown(inputs['transport_data'], inputs['appliances_data'], inputs['diet_data'],
+                                    inputs['gas_usage'], inputs['waste_amount'], inputs['recycles'],
+                                    inputs['water_usage'], factor_set.factors)
+    total_emissions = sum(breakdown.values())
+    
+    if not inputs['dry_run']:
+        try:
+            save_daily_emission(current_user.id, inputs['date'], breakdown, total_emissions, inputs['transport_data'],
+                                inputs['appliances_data'], inputs['diet_data'], inputs['gas_usage'],
+                                inputs['waste_amount'], inputs['recycles'], inputs['water_usage'],
+                                factor_set.version)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error in calculate API: {str(e)}")
+            return jsonify({'errors': ['Failed to save emissions']}), 500
+    
+    return jsonify({
+        'date': inputs['date'].isoformat(),
+        'breakdown': breakdown,
+        'total': round(total_emissions, 2),
+        'suggestions': generate_suggestions(breakdown),
+        'factor_version': factor_set.version,
+        'saved': not inputs['dry_run']
+    })
+
+@bp.route('/history')
+@login_required
+@read_replica
 def history():
     try:
-        # Get user-specific emissions data from database
-        user_emissions = Emission.query.filter_by(user_id=current_user.id)\
-                                     .order_by(Emission.date.desc()).all()
+        # Summary statistics are aggregated in the database
+        summary = get_summary(current_user.id)
         
-        if not user_emissions:
+        if not summary['total_entries']:
             return render_template('history.html', 
                                  emissions_data=[], 
                                  chart_dates=[], 
@@ -429,31 +650,31 @@ def history():
                                  total_entries=0,
                                  average_daily=0,
                                  highest_day=0,
-                                 lowest_day=0)
-        
-        # Convert to dictionary format for template compatibility
-        emissions_data = [emission.to_dict() for emission in user_emissions]
+                                 lowest_day=0,
+                                 newer_cursor=None,
+                                 older_cursor=None)
         
-        # Calculate statistics
-        total_entries = len(emissions_data)
-        total_sum = sum(entry['total'] for entry in emissions_data)
-        average_daily = total_sum / total_entries if total_entries > 0 else 0
-        highest_day = max(entry['total'] for entry in emissions_data)
-        lowest_day = min(entry['total'] for entry in emissions_data)
+        # Nothing changed since the client's copy: skip the chart and page queries
+        etag = page_etag(current_user.id, current_user.username, summary['total_entries'], summary['last_updated'])
+        if page_not_modified(etag, summary['last_updated']):
+            return private_cache(Response(status=304), etag, summary['last_updated'])
         
         # Prepare data for charts (last 30 entries)
-        chart_data = list(reversed(emissions_data[-30:]))
-        dates = [entry['date'] for entry in chart_data]
-        totals = [entry['total'] for entry in chart_data]
+        dates, totals = get_chart_window(current_user.id)
         
-        return render_template('history.html', 
-                             emissions_data=emissions_data,
-                             chart_dates=dates,
-                             chart_totals=totals,
-                             total_entries=total_entries,
-                             average_daily=round(average_daily, 2),
-                             highest_day=round(highest_day, 2),
-                             lowest_day=round(lowest_day, 2))
+        # Fetch a single page of the table using the date cursor
+        page = get_page(current_user.id,
+                        before=parse_cursor(request.args.get('before')),
+                        after=parse_cursor(request.args.get('after')))
+        
+        response = make_response(render_template('history.html', 
+                                                 emissions_data=page['entries'],
+                                                 chart_dates=dates,
+                                                 chart_totals=totals,
+                                                 newer_cursor=page['newer_cursor'],
+                                                 older_cursor=page['older_cursor'],
+                                                 **summary))
+        return private_cache(response, etag, summary['last_updated'])
         
     except Exception as e:
         logging.error(f"Error in history route: {str(e)}")
@@ -465,17 +686,199 @@ def history():
                              total_entries=0,
                              average_daily=0,
                              highest_day=0,
-                             lowest_day=0)
+                             lowest_day=0,
+                             newer_cursor=None,
+                             older_cursor=None)
+
+@bp.route('/api/trends')
+@login_required
+@read_replica
+def api_trends():
+    """API endpoint for rolling averages, week-over-week changes and a short forecast"""
+    days = request.args.get('days', TRENDS_DEFAULT_DAYS, type=int)
+    return jsonify(get_trends(current_user.id, days))
+
+@bp.route('/api/percentiles')
+@login_required
+@read_replica
+def api_percentiles():
+    """API endpoint comparing the user's average daily emissions for a month with all users"""
+    start = None
+    if request.args.get('month'):
+        try:
+            start = datetime.strptime(request.args['month'], '%Y-%m').date()
+        except ValueError:
+            return jsonify({'error': 'month must be formatted as YYYY-MM'}), 400
+    
+    result = cohort_percentiles(current_user.id, start)
+    if result is None:
+        return jsonify({'error': 'No entries for this month'}), 404
+    return jsonify(result)
+
+@bp.route('/history/export.csv')
+@login_required
+@read_replica
+def export_history_csv():
+    """Stream the user's full emission history as CSV"""
+    return Response(stream_with_context(generate_csv(current_user.id)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename=emissions-{current_user.id}.csv'})
 
-@app.route('/api/fuel-types/<vehicle>')
+@bp.route('/history/export.ndjson')
+@login_required
+@read_replica
+def export_history_ndjson():
+    """Stream the user's full emission history as newline-delimited JSON"""
+    return Response(stream_with_context(generate_ndjson(current_user.id)),
+                    mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename=emissions-{current_user.id}.ndjson'})
+
+@bp.route('/api/fuel-types/<vehicle>')
 def get_fuel_types(vehicle):
     """API endpoint to get fuel types for a vehicle"""
     try:
-        fuel_types = list(EMISSION_FACTORS['transportation'].get(vehicle, {}).keys())
-        return jsonify(fuel_types)
+        factor_set = emission_factors.current()
+        return reference_response(list(factor_set.vehicle_fuels.get(vehicle, ())), factor_set.version)
     except Exception as e:
         logging.error(f"Error getting fuel types: {str(e)}")
         return jsonify([])
 
+@bp.route('/api/factors')
+def get_factors():
+    """API endpoint returning all emission factors and the fuel options for every vehicle"""
+    factor_set = emission_factors.current()
+    vehicle_fuels = {vehicle: list(fuels) for vehicle, fuels in factor_set.vehicle_fuels.items()}
+    return reference_response({'version': factor_set.version, 'vehicle_fuels': vehicle_fuels,
+                               'factors': factor_set.as_dict()}, factor_set.version)
+
+@bp.route('/api/emissions/bulk', methods=['POST'])
+@api_token_required
+def bulk_emissions():
+    """API endpoint to calculate and store many day-records in one pass"""
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a JSON list of records or {"records": [...]}'}), 400
+    
+    from batch_calculator import BatchInputError, calculate_batch
+    
+    try:
+        rows = calculate_batch(records, get_factor_tables())
+    except BatchInputError as e:
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    
+    # Reject the whole batch if it references unknown users
+    user_ids = {row['user_id'] for row in rows}
+    known_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    unknown_ids = sorted(user_ids - known_ids)
+    if unknown_ids:
+        return jsonify({'error': 'Unknown user ids', 'user_ids': unknown_ids}), 400
+    
+    try:
+        upsert_emissions(rows)
+        refresh_rollups((row['user_id'], row['date']) for row in rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in bulk emissions import: {str(e)}")
+        return jsonify({'error': 'Failed to store emissions'}), 500
+    
+    return jsonify({'processed': len(rows)})
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the database tables and indexes"""
+    init_db()
+    click.echo("Initialized the database")
+
+@click.command('rebuild-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild rollups for this user.')
+@with_appcontext
+def rebuild_rollups_command(user_id):
+    """Backfill weekly and monthly rollups from existing emission rows"""
+    users = rebuild_rollups(user_id)
+    click.echo(f"Rebuilt rollups for {users} users")
+
+@click.command('import-legacy')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='User that will own the imported records.')
+@click.option('--overwrite', is_flag=True, help='Replace days that already exist for the user.')
+@with_appcontext
+def import_legacy_command(path, username, overwrite):
+    """Import a legacy data/emissions.json dump into the database"""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"Unknown user: {username}")
+    
+    processed, invalid = import_legacy_emissions(
+        path, user.id, overwrite=overwrite,
+        progress=lambda count: click.echo(f"  {count} records processed")
+    )
+    click.echo(f"Processed {processed} legacy records for {username} ({invalid} invalid records skipped)")
+
+@click.command('migrate-appliances')
+@click.option('--batch-size', type=int, default=500, help='Emission rows converted per commit.')
+@with_appcontext
+def migrate_appliances_command(batch_size):
+    """Convert legacy appliance_usage JSON into emission_appliances rows"""
+    converted = migrate_appliance_usage(batch_size, progress=lambda count: click.echo(f"  {count} rows converted"))
+    click.echo(f"Converted appliance usage for {converted} emission rows")
+
+@click.command('appliance-report')
+@click.option('--appliance', default=None, help='Only report this appliance.')
+@with_appcontext
+def appliance_report_command(appliance):
+    """Print appliance hours per month across all users"""
+    click.echo(f"{'Month':<8} {'Appliance':<16} {'Hours':>10} {'Users':>7} {'Entries':>8}")
+    with replica_reads():
+        rows = appliance_hours_by_month(appliance)
+    for month, name, hours, users, entries in rows:
+        click.echo(f"{month:<8} {name:<16} {hours:>10.1f} {users:>7} {entries:>8}")
+
+@click.command('recompute-emissions')
+@click.option('--all', 'recompute_all', is_flag=True,
+              help='Recompute every row, e.g. after a formula change, not only rows from older factor versions.')
+@click.option('--chunk-size', type=int, default=500, help='Rows read, calculated and written per transaction.')
+@click.option('--workers', type=int, default=min(4, os.cpu_count() or 1),
+              help='Calculation processes (0 calculates in this process).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an interrupted run.')
+@with_appcontext
+def recompute_emissions_command(recompute_all, chunk_size, workers, restart):
+    """Recalculate stored emission totals from their raw inputs with the current factors"""
+    factor_set = emission_factors.current()
+    click.echo(f"Recomputing with emission factors version {factor_set.version}")
+    read, updated, skipped = recompute_emissions(
+        factor_set, recompute_all, chunk_size, workers, restart,
+        progress=lambda read, updated, skipped: click.echo(f"  {read} rows read, {updated} updated, {skipped} skipped"))
+    click.echo(f"Recomputed {read} rows, {updated} updated, {skipped} skipped without usable inputs")
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Minify, fingerprint and precompress the static assets and write their manifest"""
+    manifest = build_assets(current_app.static_folder)
+    for name, built in sorted(manifest.items()):
+        click.echo(f"{name} -> {built}")
+    click.echo("Restart the workers to serve the new build")
+
+@click.command('archive-emissions')
+@click.option('--days', type=int, default=None,
+              help='Archive months that ended this many days ago (default: ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+@with_appcontext
+def archive_emissions_command(days, batch_size):
+    """Move old emission rows from the emissions table into the archive"""
+    if days is None:
+        days = current_app.config['ARCHIVE_AFTER_DAYS']
+    # Whole months are archived, so a month is never split between the two tables
+    before = (date.today() - timedelta(days=days)).replace(day=1)
+    click.echo(f"Archiving emission rows dated before {before}")
+    moved = archive_emissions(before, batch_size, progress=lambda moved: click.echo(f"  {moved} rows archived"))
+    click.echo(f"Archived {moved} rows")
+
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
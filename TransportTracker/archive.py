@@ -0,0 +1,240 @@
+import os
+import logging
+from datetime import datetime
+from sqlalchemy import JSON, Column, Date, DateTime, Integer, MetaData, Table, delete, event, select, text, tuple_, union_all
+from models import db, ArchiveState, Emission, EmissionAppliance, EmissionTransport
+from emission_store import appliance_usage_for, dialect_insert, transport_legs_for
+from sqlite_profile import sqlite_pragmas
+
+# Schema holding the archive: an attached database file on SQLite, a schema on PostgreSQL
+ARCHIVE_SCHEMA = 'archive'
+
+# ArchiveState row for the emissions table
+EMISSIONS_ARCHIVE = 'emissions'
+
+# SQLite profile pragmas that apply per attached database rather than per connection
+ATTACHED_PRAGMAS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size')
+
+# Emission columns copied into the archive unchanged
+ARCHIVED_COLUMNS = tuple(col.name for col in Emission.__table__.columns
+                         if col.name not in ('id', 'user_id', 'date', 'appliance_usage'))
+
+# Kept apart from db.metadata so create_all() leaves it alone; ensure_archive() creates it.
+# Child rows are folded into JSON lists, and (user_id, date) is the only index.
+archive_metadata = MetaData()
+emissions_archive = Table(
+    'emissions_archive', archive_metadata,
+    Column('user_id', Integer, primary_key=True),
+    Column('date', Date, primary_key=True),
+    Column('emission_id', Integer),
+    *[Column(name, Emission.__table__.c[name].type) for name in ARCHIVED_COLUMNS],
+    Column('appliance_usage', JSON),
+    Column('transport_legs', JSON),
+    Column('archived_at', DateTime, default=datetime.utcnow),
+    schema=ARCHIVE_SCHEMA,
+    postgresql_partition_by='RANGE (date)',
+)
+
+def archive_path_for(database):
+    """Default archive file for a SQLite database file: name-archive.db next to it"""
+    if not database or database == ':memory:':
+        return ':memory:'
+    stem, ext = os.path.splitext(database)
+    return f'{stem}-archive{ext or ".db"}'
+
+def _attacher(path, pragmas):
+    def attach_archive(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (path,))
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {ARCHIVE_SCHEMA}.{name} = {value}')
+        finally:
+            cursor.close()
+    return attach_archive
+
+def init_archive(app):
+    """Attach the archive database to every new connection of the app's SQLite engines
+
+    The primary uses ARCHIVE_DATABASE_PATH when set; every other file gets the
+    archive next to it. The SQLite profile's per-database pragmas (WAL,
+    synchronous, cache sizes) are applied to the attached file as well.
+    """
+    pragmas = {name: value for name, value in sqlite_pragmas(app.config).items() if name in ATTACHED_PRAGMAS}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            path = app.config.get('ARCHIVE_DATABASE_PATH') if key is None else None
+            event.listen(engine, 'connect', _attacher(path or archive_path_for(engine.url.database), pragmas))
+
+def ensure_archive():
+    """Create the archive schema and table if they do not exist yet"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+        archive_metadata.create_all(connection)
+
+_partition_years = set()
+
+def _ensure_partitions(years):
+    """Create the yearly PostgreSQL partitions the given years need, in their own transactions"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for year in sorted(set(years) - _partition_years):
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.emissions_archive_{year} '
+                f'PARTITION OF {ARCHIVE_SCHEMA}.emissions_archive '
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            ))
+        _partition_years.add(year)
+
+def archive_cutoff():
+    """Return the date before which emission rows may live in the archive, or None if nothing was archived"""
+    return db.session.query(ArchiveState.archived_before)\
+                     .filter(ArchiveState.name == EMISSIONS_ARCHIVE).scalar()
+
+def with_archived(names, where, cutoff):
+    """Select the named columns from emissions and, with a `cutoff`, from archived days too
+
+    `where` receives a table's column collection (emissions or the archive)
+    and returns filter criteria, so both sides are filtered alike. A day found
+    in both (while a batch is being moved) is taken from the hot table. Without
+    a cutoff only emissions is read.
+    """
+    hot = Emission.__table__.c
+    stmt = select(*[hot[name] for name in names]).where(*where(hot))
+    if cutoff is None:
+        return stmt
+
+    archived = emissions_archive.c
+    in_hot = select(hot.id).where(hot.user_id == archived.user_id, hot.date == archived.date).exists()
+    return union_all(stmt, select(*[archived[name] for name in names]).where(*where(archived), ~in_hot))
+
+def _lock_batch(emission_ids):
+    """Begin a transaction in which the batch's hot rows cannot change until commit"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # pysqlite only begins a transaction at the first write; take the write lock up front
+        db.session.execute(text('BEGIN IMMEDIATE'))
+    else:
+        db.session.query(Emission.id).filter(Emission.id.in_(emission_ids)).with_for_update().all()
+
+def _copy_batch(emission_ids):
+    """Upsert a batch of emission rows into the archive, child rows folded into JSON lists"""
+    table = Emission.__table__
+    rows = db.session.execute(select(table).where(table.c.id.in_(emission_ids))).all()
+    appliances = appliance_usage_for(emission_ids)
+    legs = transport_legs_for(emission_ids)
+
+    archived_at = datetime.utcnow()
+    records = []
+    for row in rows:
+        record = {name: getattr(row, name) for name in ARCHIVED_COLUMNS}
+        record.update(user_id=row.user_id, date=row.date, emission_id=row.id, archived_at=archived_at,
+                      appliance_usage=appliances.get(row.id, row.appliance_usage or []),
+                      transport_legs=legs.get(row.id, []))
+        records.append(record)
+    if not records:
+        return
+
+    stmt = dialect_insert()(emissions_archive)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date'],
+        set_={col.name: stmt.excluded[col.name] for col in emissions_archive.columns
+              if col.name not in ('user_id', 'date')}
+    )
+    db.session.execute(stmt, records)
+
+def _delete_copied(emission_ids):
+    """Delete the batch's hot rows whose archived copy is still in place; returns how many
+
+    A day re-saved after it was copied has had its copy removed by
+    drop_archived_days(), so its new values stay in the hot table.
+    """
+    archive = emissions_archive.c
+    copied = select(archive.emission_id).where(archive.user_id == Emission.user_id,
+                                               archive.date == Emission.date,
+                                               archive.emission_id == Emission.id).exists()
+    table = Emission.__table__
+    deleted = db.session.execute(delete(table).where(table.c.id.in_(emission_ids), copied)
+                                 .returning(table.c.id)).scalars().all()
+    if deleted:
+        for model in (EmissionAppliance, EmissionTransport):
+            db.session.execute(delete(model).where(model.emission_id.in_(deleted)))
+    return len(deleted)
+
+def archive_emissions(before, batch_size=1000, progress=None):
+    """Move emission rows dated before `before` into the archive, in committed batches
+
+    The recorded cutoff only moves forward, and each run also moves days
+    re-saved below it since the last run. It is recorded before any row moves,
+    so readers look in the archive while rows are in flight. Each batch is
+    copied and then deleted in two transactions, with the rows locked in both:
+    on SQLite a transaction spanning the attached file is not atomic across
+    files in WAL mode, and an interruption between the two leaves a duplicate
+    (which readers resolve in favour of the hot row) rather than a loss.
+    Rollups are untouched; they keep covering archived days. Returns the number
+    of rows moved.
+    """
+    state = db.session.get(ArchiveState, EMISSIONS_ARCHIVE) or ArchiveState(name=EMISSIONS_ARCHIVE)
+    if state.archived_before is None or state.archived_before < before:
+        state.archived_before = before
+    cutoff = state.archived_before
+    db.session.add(state)
+    db.session.commit()
+
+    moved = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Emission.id, Emission.date)\
+                          .filter(Emission.id > last_id, Emission.date < cutoff)\
+                          .order_by(Emission.id).limit(batch_size).all()
+        db.session.rollback()
+        if not batch:
+            break
+        _ensure_partitions(day.year for _, day in batch)
+
+        emission_ids = [emission_id for emission_id, _ in batch]
+        _lock_batch(emission_ids)
+        _copy_batch(emission_ids)
+        db.session.commit()
+
+        _lock_batch(emission_ids)
+        moved += _delete_copied(emission_ids)
+        db.session.commit()
+
+        last_id = emission_ids[-1]
+        if progress:
+            progress(moved)
+
+    logging.info(f"Archived {moved} emission rows dated before {cutoff}")
+    return moved
+
+def drop_archived_days(records):
+    """Delete archived copies of days being written to the hot table (caller commits)
+
+    Keeps each (user_id, date) in exactly one place. Only days older than the
+    archive cutoff can have a copy, so recent days cost one state lookup.
+    """
+    cutoff = archive_cutoff()
+    if cutoff is None:
+        return
+    days = {(record['user_id'], record['date']) for record in records}
+    days = [day for day in days if day[1] < cutoff]
+    if days:
+        db.session.execute(delete(emissions_archive)
+                           .where(tuple_(emissions_archive.c.user_id, emissions_archive.c.date).in_(days)))
+
+def archived_days(records):
+    """Return the (user_id, date) pairs of `records` that exist in the archive"""
+    cutoff = archive_cutoff()
+    if cutoff is None:
+        return set()
+    days = {(record['user_id'], record['date']) for record in records}
+    days = [day for day in days if day[1] < cutoff]
+    if not days:
+        return set()
+    key = tuple_(emissions_archive.c.user_id, emissions_archive.c.date)
+    return set(db.session.execute(select(emissions_archive.c.user_id, emissions_archive.c.date)
+                                  .where(key.in_(days))).tuples())
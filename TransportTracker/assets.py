@@ -0,0 +1,238 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+from flask import current_app, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.http import parse_accept_header
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+# Source files under static/ that the build step fingerprints
+ASSET_SOURCES = ('style.css', 'script.js')
+
+# Build output, relative to the static folder; served by AssetMiddleware
+ASSET_BUILD_DIR = 'dist'
+ASSET_MANIFEST = 'manifest.json'
+
+# Fingerprinted files never change under the same name
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Precompressed variants, in order of preference: (Accept-Encoding token, file suffix)
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Quoted strings (group 1), copied unchanged, and comments, dropped, when minifying CSS
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.S)
+
+def _minify_css_code(source):
+    """Collapse the whitespace of a stylesheet fragment that has no strings or comments"""
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}')
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from a stylesheet, leaving quoted strings unchanged"""
+    out = []
+    code, pos = '', 0
+    for match in _CSS_TOKENS.finditer(source):
+        code += source[pos:match.start()]
+        if match.group(1):
+            out.append(_minify_css_code(code))
+            out.append(match.group(1))
+            code = ''
+        pos = match.end()
+    out.append(_minify_css_code(code + source[pos:]))
+    return ''.join(out).strip()
+
+def _literal_end(source, start, quote):
+    """Index just past the string or template literal opened at `start`"""
+    i = start + 1
+    while i < len(source):
+        if source[i] == '\\':
+            i += 2
+            continue
+        if source[i] == quote:
+            return i + 1
+        i += 1
+    return len(source)
+
+def _regex_end(source, start):
+    """Index just past the regex literal body opened at `start` (flags follow as normal text)"""
+    i, in_class = start + 1, False
+    while i < len(source) and source[i] != '\n':
+        if source[i] == '\\':
+            i += 2
+            continue
+        if source[i] == '[':
+            in_class = True
+        elif source[i] == ']':
+            in_class = False
+        elif source[i] == '/' and not in_class:
+            return i + 1
+        i += 1
+    return i
+
+def minify_js(source):
+    """Strip comments, indentation and blank lines from a script
+
+    Conservative by design: string, template and regex literals are copied
+    unchanged, runs of whitespace become one space and line breaks are kept, so
+    automatic semicolon insertion behaves exactly as in the source.
+    """
+    out = []
+    last = ''
+    i, n = 0, len(source)
+    while i < n:
+        ch = source[i]
+        if ch in '\'"`':
+            end = _literal_end(source, i, ch)
+            out.append(source[i:end])
+            last, i = ch, end
+        elif source.startswith('//', i):
+            i = source.find('\n', i)
+            i = n if i == -1 else i
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            if out and out[-1] not in ' \n':
+                out.append(' ')
+        elif ch == '/' and (not last or last in '(,=:[!&|?{};+-*%<>~^'):
+            end = _regex_end(source, i)
+            out.append(source[i:end])
+            last, i = '/', end
+        elif ch.isspace():
+            newline = False
+            while i < n and source[i].isspace():
+                newline = newline or source[i] == '\n'
+                i += 1
+            while out and out[-1] == ' ':
+                out.pop()
+            if newline:
+                if out and out[-1] != '\n':
+                    out.append('\n')
+            elif out and out[-1] != '\n':
+                out.append(' ')
+        else:
+            out.append(ch)
+            last = ch
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _compressors():
+    """Return {suffix: compress function} for the available precompressed encodings"""
+    compressors = {'.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        logging.warning("brotli is not installed; skipping .br asset variants")
+    else:
+        compressors['.br'] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+def build_assets(static_folder):
+    """Minify, fingerprint and precompress ASSET_SOURCES into the build directory
+
+    Each file is written as name.<hash>.ext plus .gz and (with the brotli package)
+    .br variants, and the manifest maps source names to the built paths. Files of
+    earlier builds are kept, so pages rendered before a deploy still find their
+    assets. Returns the manifest.
+    """
+    build_dir = os.path.join(static_folder, ASSET_BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+    compressors = _compressors()
+
+    manifest = {}
+    for name in ASSET_SOURCES:
+        stem, ext = os.path.splitext(name)
+        with open(os.path.join(static_folder, name), 'r', encoding='utf-8') as f:
+            data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        with open(os.path.join(build_dir, built), 'wb') as f:
+            f.write(data)
+        for suffix, compress in compressors.items():
+            with open(os.path.join(build_dir, built + suffix), 'wb') as f:
+                f.write(compress(data))
+        manifest[name] = f'{ASSET_BUILD_DIR}/{built}'
+
+    # Written last and replaced atomically, so workers never see a half-built set
+    path = os.path.join(build_dir, ASSET_MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+def load_manifest(static_folder):
+    """Read the asset manifest, or return {} when no build exists"""
+    path = os.path.join(static_folder, ASSET_BUILD_DIR, ASSET_MANIFEST)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.error(f"Error loading asset manifest: {str(e)}")
+        return {}
+
+def asset_url(filename):
+    """URL of a static asset, fingerprinted when it has been built"""
+    return url_for('static', filename=current_app.extensions['asset_manifest'].get(filename, filename))
+
+def manifest_digest():
+    """Digest of the loaded manifest, so rendered-page ETags change when assets do"""
+    manifest = current_app.extensions['asset_manifest']
+    return hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest() if manifest else ''
+
+def asset_response(build_dir, filename, environ):
+    """Response for a built asset, precompressed when the client accepts it, cached for a year"""
+    path = safe_join(build_dir, filename)
+    if path is None or not os.path.isfile(path):
+        return NotFound()
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    encoding = None
+    accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+    for token, suffix in ASSET_ENCODINGS:
+        if accepted.quality(token) > 0 and os.path.isfile(path + suffix):
+            encoding = token
+            path += suffix
+            break
+
+    response = send_file(path, environ, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+class AssetMiddleware:
+    """Serves built assets in front of the Flask app
+
+    These requests never need the session, user loading or metrics, and going
+    through Flask would mark every response Vary: Cookie, which defeats shared caches.
+    """
+
+    def __init__(self, wsgi_app, build_dir, url_prefix):
+        self.wsgi_app = wsgi_app
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.url_prefix):
+            return self.wsgi_app(environ, start_response)
+        return asset_response(self.build_dir, path[len(self.url_prefix):], environ)(environ, start_response)
+
+def init_assets(app):
+    """Load the asset manifest, serve the build directory and register the asset_url() template helper"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+    app.wsgi_app = AssetMiddleware(app.wsgi_app, os.path.join(app.static_folder, ASSET_BUILD_DIR),
+                                   f'{app.static_url_path}/{ASSET_BUILD_DIR}/')
+    app.add_template_global(asset_url)
@@ -0,0 +1,165 @@
+from datetime import date
+from metrics import timed
+from validation import NUMBER_RULE, input_number
+
+class BatchInputError(ValueError):
+    """Raised when a day-record in a batch cannot be parsed"""
+
+    def __init__(self, index, message):
+        super().__init__(f"Record {index}: {message}")
+        self.index = index
+
+class FactorTables:
+    """Emission factors flattened into single-level lookups for the batch loop
+
+    Unknown vehicles, appliances and meats count 0, matching the per-form
+    functions which skip them. `version` is the factor version recorded on
+    every calculated row.
+    """
+
+    def __init__(self, factors, version=None):
+        self.version = version
+        self.transport = {(vehicle, fuel): factor
+                          for vehicle, fuels in factors['transportation'].items()
+                          for fuel, factor in fuels.items()}
+        self.appliances = dict(factors['appliances'])
+        self.meats = dict(factors['diet'])
+        self.electricity = factors['electricity']
+        self.vegetarian = factors['diet']['Vegetarian']
+        self.gas = factors['gas']
+        self.waste_recycled = factors['waste']['recycled']
+        self.waste_not_recycled = factors['waste']['not_recycled']
+        self.water = factors['water']
+
+def _number(index, value, field):
+    """Validate a numeric input with input_number(), reporting the offending record on failure"""
+    number = input_number(value)
+    if number is None:
+        raise BatchInputError(index, f"'{field}' {NUMBER_RULE}")
+    return number
+
+def _list(index, value, field):
+    """Return an optional list input, reporting the offending record if it is not a list"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise BatchInputError(index, f"'{field}' must be a list")
+    return value
+
+def _object(index, value, field):
+    """Return an optional object input, reporting the offending record if it is not an object"""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise BatchInputError(index, f"'{field}' must be an object")
+    return value
+
+def _name(index, value, field):
+    """Return an optional factor name, reporting the offending record if it is not a string"""
+    if value is not None and not isinstance(value, str):
+        raise BatchInputError(index, f"'{field}' must be a string")
+    return value
+
+def _day(index, record):
+    """Return the record's (user_id, date) key, reporting the record if either is missing or malformed"""
+    try:
+        user_id = int(record['user_id'])
+        value = record['date']
+        # fromisoformat also takes YYYYMMDD; only YYYY-MM-DD is accepted
+        if not isinstance(value, str) or len(value) != 10:
+            raise ValueError(value)
+        return user_id, date.fromisoformat(value)
+    except (KeyError, TypeError, ValueError):
+        raise BatchInputError(index, "'user_id' and 'date' (YYYY-MM-DD) are required")
+
+def calculate_record(index, record, tables):
+    """Validate one day-record and return its Emission column dictionary
+
+    Categories are summed in input order and rounded exactly like the
+    /calculate form path. Records look like the /calculate form, keyed by user and date:
+    {"user_id": 1, "date": "2025-07-01",
+     "transport": [{"vehicle": "Car", "fuel": "Petrol", "distance": 12}],
+     "appliances": [{"appliance": "AC", "hours": 3}],
+     "diet": {"type": "Non-Vegetarian", "frequency": 2, "meat_types": ["Chicken"]},
+     "gas_usage": 0.5, "waste_amount": 1, "recycles": true, "water_usage": 150}
+    """
+    if not isinstance(record, dict):
+        raise BatchInputError(index, "must be an object")
+    user_id, day = _day(index, record)
+
+    transportation = 0
+    legs = []
+    for n, leg in enumerate(_list(index, record.get('transport'), 'transport')):
+        leg = _object(index, leg, f'transport[{n}]')
+        vehicle = _name(index, leg.get('vehicle'), 'vehicle')
+        fuel = _name(index, leg.get('fuel'), 'fuel')
+        distance = _number(index, leg.get('distance'), 'distance')
+        transportation += distance * tables.transport.get((vehicle, fuel), 0.0)
+        legs.append({'vehicle': vehicle, 'fuel': fuel, 'distance': distance})
+
+    kwh = 0
+    usage = []
+    for n, item in enumerate(_list(index, record.get('appliances'), 'appliances')):
+        item = _object(index, item, f'appliances[{n}]')
+        appliance = _name(index, item.get('appliance'), 'appliance')
+        hours = _number(index, item.get('hours'), 'hours')
+        kwh += hours * tables.appliances.get(appliance, 0.0)
+        usage.append({'appliance': appliance, 'hours': hours})
+
+    diet = _object(index, record.get('diet'), 'diet')
+    diet_type = _name(index, diet.get('type'), 'type')
+    frequency = _number(index, diet.get('frequency'), 'frequency')
+    meats = list(_list(index, diet.get('meat_types'), 'meat_types'))
+    meat_total = 0
+    for n, meat in enumerate(meats):
+        # Assume 100g serving per meal
+        meat_total += frequency * tables.meats.get(_name(index, meat, f'meat_types[{n}]'), 0.0)
+
+    gas_usage = _number(index, record.get('gas_usage'), 'gas_usage')
+    waste_amount = _number(index, record.get('waste_amount'), 'waste_amount')
+    recycles = bool(record.get('recycles'))
+    water_usage = _number(index, record.get('water_usage'), 'water_usage')
+
+    breakdown = (
+        round(transportation, 2),
+        round(kwh * tables.electricity, 2),
+        round(frequency * tables.vegetarian * 7 if diet_type == 'Vegetarian' else meat_total, 2),  # per week
+        round(gas_usage * tables.gas, 2),
+        round(waste_amount * (tables.waste_recycled if recycles else tables.waste_not_recycled), 2),
+        round(water_usage * tables.water, 2),
+    )
+    return {
+        'user_id': user_id,
+        'date': day,
+        'transport_total': breakdown[0],
+        'electricity_total': breakdown[1],
+        'diet_total': breakdown[2],
+        'gas_total': breakdown[3],
+        'waste_total': breakdown[4],
+        'water_total': breakdown[5],
+        'total_emissions': round(sum(breakdown), 2),
+        'factor_version': tables.version,
+        'transport_legs': legs,
+        'appliance_usage': usage,
+        'diet_type': diet_type,
+        'diet_frequency': frequency,
+        'meat_types': meats,
+        'gas_usage': gas_usage,
+        'waste_amount': waste_amount,
+        'waste_recycled': recycles,
+        'water_usage': water_usage,
+    }
+
+@timed
+def calculate_batch(records, tables):
+    """Calculate emissions for many day-records and return Emission column dictionaries
+
+    One pass per record with plain lookups: batches are dominated by reading
+    and validating each record, so there is nothing to vectorize. When the same
+    (user_id, date) appears more than once, the last record wins.
+    """
+    rows = {}
+    for i, record in enumerate(records):
+        row = calculate_record(i, record, tables)
+        rows[(row['user_id'], row['date'])] = row
+    return list(rows.values())
@@ -0,0 +1,75 @@
+"""Measure worker cold-start time.
+
+Each run starts a fresh interpreter and imports `main`, which is what a gunicorn
+worker does when the app is not preloaded. The import is timed from inside the
+child process so interpreter startup is reported separately.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 20] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+import support
+
+CHILD_SCRIPT = """
+import time, json
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+print(json.dumps({'import_main': imported - start}))
+"""
+
+def run_once():
+    """Boot one fresh interpreter and return (total seconds, import seconds)"""
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=support.PROJECT_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    total = time.perf_counter() - start
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    return total, child['import_main']
+
+def summarize(samples):
+    """Return min/median/p90/max in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'min_ms': round(ordered[0] * 1000, 2),
+        'median_ms': round(statistics.median(ordered) * 1000, 2),
+        'p90_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--output', default='-', help="Write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+
+    totals, imports = [], []
+    for _ in range(args.runs):
+        total, imported = run_once()
+        totals.append(total)
+        imports.append(imported)
+
+    boot, imported = summarize(totals), summarize(imports)
+    print(f"Cold start over {args.runs} runs", file=sys.stderr)
+    for name, stats in (('process_boot', boot), ('import_main', imported)):
+        print(f"  {name:<13} min {stats['min_ms']:>8} ms  median {stats['median_ms']:>8} ms  "
+              f"p90 {stats['p90_ms']:>8} ms  max {stats['max_ms']:>8} ms", file=sys.stderr)
+
+    support.write_results(args.output, 'cold_start', [{
+        'benchmark': 'cold_start',
+        'runs': args.runs,
+        'process_boot_median_ms': boot['median_ms'],
+        'import_main_median_ms': imported['median_ms'],
+    }])
+
+if __name__ == '__main__':
+    main()
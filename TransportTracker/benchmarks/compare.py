@@ -0,0 +1,56 @@
+"""Compare two benchmark result files and fail on regressions.
+
+Results are matched on their identifying fields (endpoint, history size,
+concurrency, function...). A result regresses when its latency metric grows
+by more than --threshold relative to the baseline.
+
+Usage:
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.15]
+"""
+import sys
+import json
+import argparse
+
+# Lower-is-better metrics checked for each result type
+LATENCY_METRICS = ('p50_ms', 'p99_ms', 'best_us_per_call', 'import_main_median_ms')
+
+# Fields that describe a measurement rather than identify it
+MEASUREMENT_FIELDS = {'requests', 'throughput_rps', 'p50_ms', 'p99_ms', 'mean_ms', 'errors',
+                      'best_us_per_call', 'best_us_per_record', 'import_main_median_ms',
+                      'process_boot_median_ms'}
+
+def _key(result):
+    return tuple(sorted((k, v) for k, v in result.items() if k not in MEASUREMENT_FIELDS))
+
+def load(path):
+    with open(path) as f:
+        return {_key(result): result for result in json.load(f)['results']}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed relative slowdown')
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    for key, result in current.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        label = ' '.join(f'{k}={v}' for k, v in key)
+        for metric in LATENCY_METRICS:
+            if metric not in result or not previous.get(metric):
+                continue
+            change = result[metric] / previous[metric] - 1
+            marker = 'REGRESSION' if change > args.threshold else 'ok'
+            regressions += marker == 'REGRESSION'
+            print(f"{marker:<10} {label} {metric}: {previous[metric]} -> {result[metric]} ({change:+.1%})")
+
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
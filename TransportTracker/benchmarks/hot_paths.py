@@ -0,0 +1,127 @@
+"""Load-test the /calculate, /history, /signin and /api/fuel-types hot paths.
+
+Synthetic users are seeded with N days of history, then each endpoint is hit
+from several threads, each with its own logged-in Flask test client. The
+run is repeated for every history size and concurrency level.
+
+Usage:
+    python benchmarks/hot_paths.py [--history-days 30,365,1825] [--concurrency 1,4]
+        [--requests 200] [--database-url postgresql://...] [--output results.json]
+
+Without --database-url each history size gets a fresh SQLite file. Pass a
+throwaway local PostgreSQL database to measure against Postgres instead; its
+tables are dropped and recreated.
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+
+import support
+
+def _form_for(rng, day):
+    """Build /calculate form fields for one synthetic day"""
+    record = support.random_record(rng)
+    form = {
+        'date': day.isoformat(),
+        'transport_count': len(record['transport']),
+        'appliance_count': len(record['appliances']),
+        'diet_type': record['diet']['type'],
+        'diet_frequency': record['diet']['frequency'],
+        'meat_types': record['diet']['meat_types'],
+        'gas_usage': record['gas_usage'],
+        'waste_amount': record['waste_amount'],
+        'recycles': 'yes' if record['recycles'] else 'no',
+        'water_usage': record['water_usage'],
+    }
+    for i, leg in enumerate(record['transport']):
+        form.update({f'transport_vehicle_{i}': leg['vehicle'], f'transport_fuel_{i}': leg['fuel'],
+                     f'transport_distance_{i}': leg['distance']})
+    for i, item in enumerate(record['appliances']):
+        form.update({f'appliance_name_{i}': item['appliance'], f'appliance_hours_{i}': item['hours']})
+    return form
+
+def _login(client, username):
+    response = client.post('/signin', data={'username': username, 'password': support.BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Sign in failed for {username}")
+
+def _make_request(endpoint, client, username, rng, counter):
+    """Issue one request for `endpoint` and return its status code"""
+    if endpoint == '/calculate':
+        # Spread writes over recent days so both inserts and updates are exercised
+        day = date.today() - timedelta(days=rng.randint(0, 60))
+        return client.post('/calculate', data=_form_for(rng, day)).status_code
+    if endpoint == '/history':
+        return client.get('/history').status_code
+    if endpoint == '/signin':
+        return client.post('/signin', data={'username': username, 'password': support.BENCH_PASSWORD}).status_code
+    vehicle = support.VEHICLE_FUELS[counter % len(support.VEHICLE_FUELS)][0]
+    return client.get(f'/api/fuel-types/{vehicle}').status_code
+
+EXPECTED_STATUS = {'/calculate': 200, '/history': 200, '/signin': 302, '/api/fuel-types': 200}
+
+def run_endpoint(app, usernames, endpoint, concurrency, total_requests):
+    """Hit one endpoint from `concurrency` threads and return latency statistics"""
+    per_thread = max(1, total_requests // concurrency)
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        client = app.test_client()
+        username = usernames[index % len(usernames)]
+        _login(client, username)
+        rng = random.Random(index)
+        barrier.wait()
+        for counter in range(per_thread):
+            start = time.perf_counter()
+            status = _make_request(endpoint, client, username, rng, counter)
+            latencies[index].append(time.perf_counter() - start)
+            if status != EXPECTED_STATUS[endpoint]:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = support.latency_stats([sample for samples in latencies for sample in samples], elapsed)
+    stats['errors'] = sum(errors)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history-days', default='30,365,1825', help='Comma-separated history sizes per user')
+    parser.add_argument('--concurrency', default='1,4', help='Comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--users', type=int, default=8, help='Seeded users per history size')
+    parser.add_argument('--endpoints', default='/calculate,/history,/signin,/api/fuel-types')
+    parser.add_argument('--database-url', default=None, help='Benchmark against this database instead of SQLite')
+    parser.add_argument('--output', default='-', help="Write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+
+    endpoints = [endpoint for endpoint in args.endpoints.split(',') if endpoint]
+    results = []
+    for days in [int(value) for value in args.history_days.split(',')]:
+        app = support.make_app(args.database_url)
+        usernames = support.seed_users(app, args.users, days)
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            for endpoint in endpoints:
+                stats = run_endpoint(app, usernames, endpoint, concurrency, args.requests)
+                stats.update(benchmark='hot_path', endpoint=endpoint, history_days=days, concurrency=concurrency)
+                results.append(stats)
+                print(f"{endpoint:<16} days={days:<5} threads={concurrency:<3} "
+                      f"{stats['throughput_rps']:>9} req/s  p50 {stats['p50_ms']:>8} ms  "
+                      f"p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}", file=sys.stderr, flush=True)
+
+    support.write_results(args.output, 'hot_paths', results)
+
+if __name__ == '__main__':
+    main()
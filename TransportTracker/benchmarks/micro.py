@@ -0,0 +1,82 @@
+"""Microbenchmarks for the emission calculation functions and generate_suggestions.
+
+Usage:
+    python benchmarks/micro.py [--repeat 7] [--number 20000] [--output results.json]
+"""
+import sys
+import random
+import timeit
+import argparse
+
+import support
+
+def build_cases():
+    """Return (name, callable, records per call) cases covering the per-form and batch calculations"""
+    import app
+    from batch_calculator import calculate_batch
+
+    rng = random.Random(7)
+    record = support.random_record(rng)
+    meat_diet = {'type': 'Non-Vegetarian', 'frequency': 2, 'meat_types': ['Chicken', 'Beef']}
+    breakdown = app.calculate_breakdown(record['transport'], record['appliances'], meat_diet,
+                                        record['gas_usage'], record['waste_amount'],
+                                        record['recycles'], record['water_usage'])
+    batch = []
+    for i in range(1000):
+        day = support.random_record(rng)
+        day.update(user_id=i, date='2025-01-01')
+        batch.append(day)
+    tables = app.get_factor_tables()
+    factors = app.emission_factors.current().factors
+
+    def calculate_day(day, validated=False):
+        if validated:
+            return app.calculate_breakdown(day['transport_data'], day['appliances_data'], day['diet_data'],
+                                           day['gas_usage'], day['waste_amount'], day['recycles'],
+                                           day['water_usage'], factors)
+        return app.calculate_breakdown(day['transport'], day['appliances'], day['diet'], day['gas_usage'],
+                                       day['waste_amount'], day['recycles'], day['water_usage'], factors)
+
+    return [
+        ('calculate_transportation_emissions', lambda: app.calculate_transportation_emissions(record['transport']), 1),
+        ('calculate_electricity_emissions', lambda: app.calculate_electricity_emissions(record['appliances']), 1),
+        ('calculate_diet_emissions', lambda: app.calculate_diet_emissions(meat_diet), 1),
+        ('calculate_breakdown', lambda: app.calculate_breakdown(record['transport'], record['appliances'], meat_diet,
+                                                                record['gas_usage'], record['waste_amount'],
+                                                                record['recycles'], record['water_usage']), 1),
+        ('generate_suggestions', lambda: app.generate_suggestions(breakdown), 1),
+        # Baselines for the batch: the same 1000 records one at a time, first calculation only,
+        # then validated as /api/calculate does (the batch also validates and builds stored rows)
+        ('calculate_breakdown_loop_1000', lambda: [calculate_day(day) for day in batch], 1000),
+        ('validate_and_calculate_loop_1000', lambda: [calculate_day(app.parse_calculation_payload(day, factors)[0],
+                                                                    validated=True)
+                                                      for day in batch], 1000),
+        ('calculate_batch_1000', lambda: calculate_batch(batch, tables), 1000),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--number', type=int, default=20000, help='Calls per repeat (scaled down for batch cases)')
+    parser.add_argument('--output', default='-', help="Write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for name, func, records_per_call in build_cases():
+        number = max(1, args.number // records_per_call)
+        timings = timeit.repeat(func, repeat=args.repeat, number=number)
+        best = min(timings) / number
+        results.append({
+            'benchmark': 'micro',
+            'function': name,
+            'records_per_call': records_per_call,
+            'best_us_per_call': round(best * 1e6, 3),
+            'best_us_per_record': round(best * 1e6 / records_per_call, 3),
+        })
+        print(f"{name:<36} {best * 1e6:>10.3f} us/call  {best * 1e6 / records_per_call:>8.3f} us/record",
+              file=sys.stderr)
+
+    support.write_results(args.output, 'micro', results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Stress a SQLite file with concurrent /calculate writers and /history readers.
+
+Each reader and writer runs in its own process with its own app and engine, as
+separate gunicorn workers would, and loops for a fixed duration. Every request
+that does not succeed is counted, and errors logged with "database is locked"
+are counted separately. The run is repeated for each SQLite profile, each on a
+fresh database, so the production profile can be compared with SQLite's defaults.
+
+Usage:
+    python benchmarks/sqlite_stress.py [--writers 4] [--readers 4] [--duration 10]
+        [--profiles production,default] [--history-days 90] [--output results.json]
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+import multiprocessing
+from datetime import date, timedelta
+
+import support
+from hot_paths import EXPECTED_STATUS, _form_for, _login
+
+class _LockErrorCounter(logging.Handler):
+    """Count logged errors that report a locked database"""
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        if 'locked' in record.getMessage():
+            self.count += 1
+
+def _worker(role, index, database_url, profile, username, duration, start_at, results):
+    """Loop /calculate (writer) or /history (reader) requests until the deadline"""
+    from app import create_app
+
+    counter = _LockErrorCounter()
+    logging.getLogger().addHandler(counter)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'METRICS_ENABLED': False,
+                      'SQLITE_PROFILE': profile})
+    client = app.test_client()
+    _login(client, username)
+    rng = random.Random(index)
+
+    endpoint = '/calculate' if role == 'writer' else '/history'
+    latencies = []
+    errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        started = time.perf_counter()
+        if role == 'writer':
+            day = date.today() - timedelta(days=rng.randint(0, 60))
+            status = client.post('/calculate', data=_form_for(rng, day)).status_code
+        else:
+            status = client.get('/history').status_code
+        latencies.append(time.perf_counter() - started)
+        if status != EXPECTED_STATUS[endpoint]:
+            errors += 1
+    results.put((role, latencies, errors, counter.count))
+
+def run_profile(profile, writers, readers, duration, history_days):
+    """Run one stress round on a fresh database and return per-role statistics"""
+    app = support.make_app(SQLITE_PROFILE=profile)
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+    usernames = support.seed_users(app, writers + readers, history_days)
+    with app.app_context():
+        from models import db
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    # Leave time for every process to import and sign in before the clock starts
+    start_at = time.time() + 5
+    roles = ['writer'] * writers + ['reader'] * readers
+    processes = [context.Process(target=_worker,
+                                 args=(role, i, database_url, profile, usernames[i], duration, start_at, results))
+                 for i, role in enumerate(roles)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    stats = []
+    for role in ('writer', 'reader'):
+        rows = [row for row in collected if row[0] == role]
+        if not rows:
+            continue
+        role_stats = support.latency_stats([sample for row in rows for sample in row[1]], duration)
+        role_stats.update(benchmark='sqlite_stress', profile=profile, role=role, processes=len(rows),
+                          errors=sum(row[2] for row in rows), lock_errors=sum(row[3] for row in rows))
+        stats.append(role_stats)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4, help='Writer processes')
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds each process runs')
+    parser.add_argument('--profiles', default='production,default', help='Comma-separated SQLITE_PROFILE values')
+    parser.add_argument('--history-days', type=int, default=90, help='Seeded days per user')
+    parser.add_argument('--output', default='-', help="Write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for profile in [value for value in args.profiles.split(',') if value]:
+        for stats in run_profile(profile, args.writers, args.readers, args.duration, args.history_days):
+            results.append(stats)
+            print(f"{profile:<11} {stats['role']:<7} x{stats['processes']:<3} "
+                  f"{stats['throughput_rps']:>9} req/s  p50 {stats['p50_ms']:>8} ms  "
+                  f"p99 {stats['p99_ms']:>9} ms  errors {stats['errors']}  locked {stats['lock_errors']}",
+                  file=sys.stderr, flush=True)
+
+    support.write_results(args.output, 'sqlite_stress', results)
+
+if __name__ == '__main__':
+    main()
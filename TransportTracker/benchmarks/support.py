@@ -0,0 +1,125 @@
+"""Shared helpers for the benchmark scripts: app setup, seeding, statistics and result files."""
+import os
+import sys
+import json
+import random
+import platform
+import tempfile
+from datetime import date, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+BENCH_PASSWORD = 'benchmark-password'
+
+VEHICLE_FUELS = (('Car', 'Petrol'), ('Car', 'Diesel'), ('Bus', 'CNG'), ('Train', 'Electric'), ('Bike', 'Electric'))
+APPLIANCES = ('AC', 'Fan', 'Fridge', 'TV', 'Heater')
+MEATS = ('Chicken', 'Beef', 'Pork', 'Fish', 'Mutton')
+
+def make_app(database_url=None, **config):
+    """Create an app bound to `database_url`, or to a fresh SQLite file when omitted"""
+    from app import create_app, init_db
+    from models import db
+
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ecobench-'), 'bench.db')}"
+    settings = {'SQLALCHEMY_DATABASE_URI': database_url, 'METRICS_ENABLED': False}
+    settings.update(config)
+
+    app = create_app(settings)
+    with app.app_context():
+        # Start from an empty schema so Postgres stand-ins can be reused between runs
+        db.drop_all(bind_key=None)
+        init_db()
+    return app
+
+def random_record(rng):
+    """Build one synthetic day of inputs in the bulk/API payload shape"""
+    vehicle, fuel = rng.choice(VEHICLE_FUELS)
+    vegetarian = rng.random() < 0.4
+    return {
+        'transport': [{'vehicle': vehicle, 'fuel': fuel, 'distance': round(rng.uniform(0, 40), 1)}],
+        'appliances': [{'appliance': name, 'hours': round(rng.uniform(0, 8), 1)}
+                       for name in rng.sample(APPLIANCES, rng.randint(1, 3))],
+        'diet': {'type': 'Vegetarian' if vegetarian else 'Non-Vegetarian',
+                 'frequency': rng.randint(1, 3),
+                 'meat_types': [] if vegetarian else rng.sample(MEATS, rng.randint(1, 2))},
+        'gas_usage': round(rng.uniform(0, 1), 2),
+        'waste_amount': round(rng.uniform(0, 3), 2),
+        'recycles': rng.random() < 0.5,
+        'water_usage': rng.randint(50, 300),
+    }
+
+def seed_users(app, users, days, seed=42):
+    """Create `users` accounts, each with `days` consecutive daily Emission rows
+
+    Returns the list of usernames. Rows are written with the bulk upsert path.
+    """
+    from app import get_factor_tables
+    from batch_calculator import calculate_batch
+    from emission_store import upsert_emissions
+    from rollups import rebuild_rollups
+    from models import db, User
+
+    rng = random.Random(seed)
+    usernames = [f'bench{i}' for i in range(users)]
+    start = date.today() - timedelta(days=days)
+
+    with app.app_context():
+        template = User(username='template', email='template@example.com')
+        template.set_password(BENCH_PASSWORD)
+        for username in usernames:
+            user = User(username=username, email=f'{username}@example.com')
+            user.password_hash = template.password_hash
+            db.session.add(user)
+        db.session.commit()
+
+        for user in User.query.filter(User.username.in_(usernames)):
+            records = []
+            for offset in range(days):
+                record = random_record(rng)
+                record.update(user_id=user.id, date=(start + timedelta(days=offset)).isoformat())
+                records.append(record)
+            for chunk in range(0, len(records), 1000):
+                upsert_emissions(calculate_batch(records[chunk:chunk + 1000], get_factor_tables()))
+            db.session.commit()
+
+        rebuild_rollups()
+    return usernames
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def latency_stats(samples, elapsed):
+    """Summarize request latencies (seconds) measured over `elapsed` wall-clock seconds"""
+    ordered = sorted(samples)
+    return {
+        'requests': len(ordered),
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+    }
+
+def environment():
+    """Describe the machine the results were measured on"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def write_results(path, suite, results):
+    """Write results as JSON to `path` ('-' for stdout)"""
+    document = {'suite': suite, 'environment': environment(), 'results': results}
+    text = json.dumps(document, indent=2)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,146 @@
+import math
+from collections import Counter
+from models import db, CohortBucket, EmissionRollup
+from emission_store import dialect_insert
+
+# Compared categories and the monthly rollup column each is averaged from
+COHORT_CATEGORIES = {
+    'total': 'total_emissions',
+    'transportation': 'transport_total',
+    'electricity': 'electricity_total',
+    'diet': 'diet_total',
+    'gas': 'gas_total',
+    'waste': 'waste_total',
+    'water': 'water_total',
+}
+
+# Histogram layout in kg CO2 per day: bucket 0 holds exact zeros, bucket 1 everything
+# below BUCKET_MIN * BUCKET_GROWTH, and each following bucket is BUCKET_GROWTH times
+# wider (about 10% resolution). Values past the last bucket are counted in it.
+BUCKET_MIN = 0.01
+BUCKET_GROWTH = 1.1
+BUCKET_COUNT = 150
+
+# Below this many users in a month no percentile is reported
+COHORT_MIN_USERS = 5
+
+# Rows inserted per statement when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+_ROLLUP_COLUMNS = [EmissionRollup.entry_count] + [getattr(EmissionRollup, col) for col in COHORT_CATEGORIES.values()]
+
+def bucket_for(value):
+    """Return the histogram bucket of an average daily value"""
+    if not value or value <= 0:
+        return 0
+    return min(BUCKET_COUNT - 1, 1 + max(0, int(math.log(value / BUCKET_MIN) / math.log(BUCKET_GROWTH))))
+
+def daily_averages(rollup):
+    """Average daily emissions per category from a monthly rollup mapping"""
+    count = rollup['entry_count'] or 0
+    return {category: (rollup[column] or 0.0) / count if count else 0.0
+            for category, column in COHORT_CATEGORIES.items()}
+
+def month_rollups(start, user_ids, for_update=False):
+    """Return {(user_id, start): rollup mapping} of the given users' rollups for one month
+
+    With `for_update` the rows are locked (where supported) until the transaction
+    ends, so concurrent writers move a user between buckets one at a time.
+    """
+    query = db.session.query(EmissionRollup.user_id, *_ROLLUP_COLUMNS)\
+                      .filter(EmissionRollup.user_id.in_(user_ids),
+                              EmissionRollup.period == 'month',
+                              EmissionRollup.period_start == start)
+    if for_update:
+        query = query.with_for_update()
+    return {(row.user_id, start): row._mapping for row in query}
+
+def update_cohort_sketches(old_rollups, new_rollups):
+    """Move users between buckets for months whose rollups changed (caller commits)
+
+    Both arguments map (user_id, month start) to a monthly rollup mapping, before
+    and after the change. Counts are adjusted with `user_count + delta` upserts,
+    so concurrent updates of different users never overwrite each other.
+    """
+    deltas = Counter()
+    for key in set(old_rollups) | set(new_rollups):
+        start = key[1]
+        for rollup, step in ((old_rollups.get(key), -1), (new_rollups.get(key), 1)):
+            if rollup is None or not rollup['entry_count']:
+                continue
+            for category, value in daily_averages(rollup).items():
+                deltas[(start, category, bucket_for(value))] += step
+
+    rows = [{'period_start': start, 'category': category, 'bucket': bucket, 'user_count': delta}
+            for (start, category, bucket), delta in deltas.items() if delta]
+    if not rows:
+        return
+
+    table = CohortBucket.__table__
+    stmt = dialect_insert()(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['period_start', 'category', 'bucket'],
+        set_={'user_count': table.c.user_count + stmt.excluded.user_count}
+    )
+    db.session.execute(stmt, rows)
+
+def rebuild_cohort_sketches():
+    """Recount every month's histograms from the monthly rollups (caller commits)"""
+    db.session.query(CohortBucket).delete(synchronize_session=False)
+
+    counts = Counter()
+    query = db.session.query(EmissionRollup.period_start, *_ROLLUP_COLUMNS)\
+                      .filter(EmissionRollup.period == 'month', EmissionRollup.entry_count > 0)\
+                      .yield_per(REBUILD_BATCH_SIZE)
+    for row in query:
+        for category, value in daily_averages(row._mapping).items():
+            counts[(row.period_start, category, bucket_for(value))] += 1
+
+    rows = [{'period_start': start, 'category': category, 'bucket': bucket, 'user_count': count}
+            for (start, category, bucket), count in counts.items()]
+    for offset in range(0, len(rows), REBUILD_BATCH_SIZE):
+        db.session.execute(CohortBucket.__table__.insert(), rows[offset:offset + REBUILD_BATCH_SIZE])
+
+def cohort_percentiles(user_id, start=None):
+    """Compare a user's average daily emissions for a month with every user's, per category
+
+    `start` is the first of the month; by default the latest month the user has
+    entries for. Reads only that month's histogram rows, so the cost does not grow
+    with the number of users. The percentile is the share of users emitting less
+    (counting half of the user's own bucket); lower is better. Returns None when
+    the user has no entries for the month.
+    """
+    if start is None:
+        start = db.session.query(EmissionRollup.period_start)\
+                          .filter(EmissionRollup.user_id == user_id, EmissionRollup.period == 'month')\
+                          .order_by(EmissionRollup.period_start.desc()).limit(1).scalar()
+        if start is None:
+            return None
+
+    own = month_rollups(start, [user_id]).get((user_id, start))
+    if own is None or not own['entry_count']:
+        return None
+    averages = daily_averages(own)
+
+    below, same, users = Counter(), Counter(), Counter()
+    buckets = db.session.query(CohortBucket.category, CohortBucket.bucket, CohortBucket.user_count)\
+                        .filter(CohortBucket.period_start == start)
+    for category, bucket, user_count in buckets:
+        if category not in averages:
+            continue
+        users[category] += user_count
+        own_bucket = bucket_for(averages[category])
+        if bucket < own_bucket:
+            below[category] += user_count
+        elif bucket == own_bucket:
+            same[category] += user_count
+
+    categories = {}
+    for category, value in averages.items():
+        count = users[category]
+        percentile = None
+        if count >= COHORT_MIN_USERS:
+            percentile = round(100 * (below[category] + same[category] / 2) / count)
+        categories[category] = {'average_daily': round(value, 2), 'percentile': percentile, 'users': count}
+
+    return {'month': start.strftime('%Y-%m'), 'categories': categories}
@@ -0,0 +1,44 @@
+import random
+from reloading import ReloadingJSONFile
+
+# Facts served when the facts file is missing or unreadable
+DEFAULT_ECO_FACTS = (
+    "A single tree can absorb 22 kg of CO₂ per year.",
+    "Walking or cycling for short trips can reduce your carbon footprint by up to 50%.",
+    "LED bulbs use 75% less energy than incandescent bulbs.",
+    "Recycling one aluminum can saves enough energy to power a TV for 3 hours.",
+    "Eating less meat one day per week can save 1,900 pounds of CO₂ per year.",
+    "Taking shorter showers can save up to 150 gallons of water per month.",
+    "Unplugging electronics when not in use can reduce energy consumption by 10%.",
+    "Using public transport instead of driving can reduce CO₂ emissions by 45%."
+)
+
+class EcoFactsProvider(ReloadingJSONFile):
+    """Serves eco facts from memory, re-reading the facts file only when its mtime changes
+
+    The file is never written from here, so request handlers only ever read the
+    in-memory tuple.
+    """
+
+    description = 'eco facts'
+
+    def __init__(self, path, check_interval=5.0):
+        super().__init__(path, check_interval)
+        self._facts = DEFAULT_ECO_FACTS
+
+    def apply(self, document):
+        """Serve the facts listed in the file, or the defaults when it lists none"""
+        self._facts = tuple(document) or DEFAULT_ECO_FACTS
+
+    def file_missing(self):
+        """Serve the default facts while there is no facts file"""
+        self._facts = DEFAULT_ECO_FACTS
+
+    def get_facts(self):
+        """Return the current facts as an immutable tuple"""
+        self.refresh()
+        return self._facts
+
+    def random_fact(self):
+        """Pick a random eco fact"""
+        return random.choice(self.get_facts())
@@ -0,0 +1,206 @@
+from sqlalchemy import delete, func, insert, inspect, null, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Emission, EmissionAppliance, EmissionTransport
+
+# Columns rewritten when an entry for an existing (user_id, date) is submitted again
+UPSERT_UPDATE_COLUMNS = (
+    'transport_total',
+    'electricity_total',
+    'diet_total',
+    'gas_total',
+    'waste_total',
+    'water_total',
+    'total_emissions',
+    'factor_version',
+    'diet_type',
+    'diet_frequency',
+    'meat_types',
+    'gas_usage',
+    'waste_amount',
+    'waste_recycled',
+    'water_usage',
+)
+
+UNIQUE_DAY_INDEX = 'ix_emissions_user_date'
+
+# Nullable columns added to emissions after its first release, created by init-db
+ADDED_COLUMNS = ('factor_version', 'diet_frequency', 'meat_types')
+
+def dialect_insert():
+    """Return the insert construct supporting ON CONFLICT for the bound database"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert
+    if dialect == 'sqlite':
+        return sqlite.insert
+    raise RuntimeError(f"Upsert is not supported for the {dialect} dialect")
+
+def upsert_emissions(records):
+    """Insert or update emission rows keyed on (user_id, date) with INSERT ... ON CONFLICT DO UPDATE
+
+    `records` is a list of column dictionaries that all share the same keys. An
+    'appliance_usage' or 'transport_legs' list replaces that day's EmissionAppliance
+    or EmissionTransport rows, and an archived copy of a written day is removed.
+    Returns the emission ids in record order; the caller commits.
+    """
+    if not records:
+        return []
+
+    child_lists = {key: [record[key] or [] for record in records] for key in CHILD_WRITERS if key in records[0]}
+    if child_lists:
+        records = [{col: value for col, value in record.items() if col not in child_lists} for record in records]
+
+    stmt = dialect_insert()(Emission.__table__)
+    update_columns = [col for col in UPSERT_UPDATE_COLUMNS if col in records[0]]
+    set_ = {col: stmt.excluded[col] for col in update_columns}
+    if 'appliance_usage' in child_lists:
+        # A legacy JSON copy is superseded by the child rows written below
+        set_['appliance_usage'] = null()
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'date'], set_=set_)\
+               .returning(Emission.__table__.c.id, sort_by_parameter_order=True)
+    emission_ids = db.session.execute(stmt, records).scalars().all()
+
+    for key, lists in child_lists.items():
+        CHILD_WRITERS[key](emission_ids, lists)
+    
+    from archive import drop_archived_days
+    drop_archived_days(records)
+    return emission_ids
+
+def replace_appliances(emission_ids, appliance_lists):
+    """Replace the EmissionAppliance rows of each emission with its {'appliance', 'hours'} list"""
+    db.session.execute(delete(EmissionAppliance).where(EmissionAppliance.emission_id.in_(emission_ids)))
+
+    rows = [
+        {'emission_id': emission_id, 'appliance': item['appliance'], 'hours': float(item.get('hours') or 0)}
+        for emission_id, items in zip(emission_ids, appliance_lists)
+        for item in items
+        if item.get('appliance')
+    ]
+    if rows:
+        db.session.execute(insert(EmissionAppliance.__table__), rows)
+
+def replace_transport_legs(emission_ids, leg_lists):
+    """Replace the EmissionTransport rows of each emission with its {'vehicle', 'fuel', 'distance'} list"""
+    db.session.execute(delete(EmissionTransport).where(EmissionTransport.emission_id.in_(emission_ids)))
+
+    rows = [
+        {'emission_id': emission_id, 'vehicle': leg['vehicle'], 'fuel': leg['fuel'],
+         'distance': float(leg.get('distance') or 0)}
+        for emission_id, legs in zip(emission_ids, leg_lists)
+        for leg in legs
+        if leg.get('vehicle') and leg.get('fuel')
+    ]
+    if rows:
+        db.session.execute(insert(EmissionTransport.__table__), rows)
+
+# Record keys holding child-row lists, and the function that stores them
+CHILD_WRITERS = {
+    'appliance_usage': replace_appliances,
+    'transport_legs': replace_transport_legs,
+}
+
+def appliance_usage_for(emission_ids):
+    """Return {emission_id: [{'appliance', 'hours'}, ...]} for emissions that have appliance rows"""
+    usage = {}
+    rows = db.session.query(EmissionAppliance.emission_id, EmissionAppliance.appliance, EmissionAppliance.hours)\
+                     .filter(EmissionAppliance.emission_id.in_(emission_ids))\
+                     .order_by(EmissionAppliance.id)
+    for emission_id, appliance, hours in rows:
+        usage.setdefault(emission_id, []).append({'appliance': appliance, 'hours': hours})
+    return usage
+
+def transport_legs_for(emission_ids):
+    """Return {emission_id: [{'vehicle', 'fuel', 'distance'}, ...]} for emissions that have transport rows"""
+    legs = {}
+    rows = db.session.query(EmissionTransport.emission_id, EmissionTransport.vehicle,
+                            EmissionTransport.fuel, EmissionTransport.distance)\
+                     .filter(EmissionTransport.emission_id.in_(emission_ids))\
+                     .order_by(EmissionTransport.id)
+    for emission_id, vehicle, fuel, distance in rows:
+        legs.setdefault(emission_id, []).append({'vehicle': vehicle, 'fuel': fuel, 'distance': distance})
+    return legs
+
+def migrate_appliance_usage(batch_size=500, progress=None):
+    """Convert legacy appliance_usage JSON into EmissionAppliance rows
+
+    Rows are processed in id order in committed batches and their JSON copy is
+    cleared, so the migration can be interrupted and re-run. Returns the number
+    of emission rows converted.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Emission.id, Emission.appliance_usage)\
+                          .filter(Emission.id > last_id, Emission.appliance_usage.isnot(None))\
+                          .order_by(Emission.id).limit(batch_size).all()
+        if not batch:
+            return converted
+
+        emission_ids = [emission_id for emission_id, _ in batch]
+        replace_appliances(emission_ids, [usage if isinstance(usage, list) else [] for _, usage in batch])
+        db.session.query(Emission).filter(Emission.id.in_(emission_ids))\
+                  .update({Emission.appliance_usage: null()}, synchronize_session=False)
+        db.session.commit()
+
+        converted += len(batch)
+        last_id = emission_ids[-1]
+        if progress:
+            progress(converted)
+
+def insert_missing_emissions(records):
+    """Insert emission rows, skipping any (user_id, date) that already exists
+
+    Uses INSERT ... ON CONFLICT DO NOTHING; the caller commits. Days kept in the
+    archive count as existing. Records must not carry child-row lists, since
+    skipped rows have no id to attach them to.
+    """
+    from archive import archived_days
+    archived = archived_days(records)
+    if archived:
+        records = [record for record in records if (record['user_id'], record['date']) not in archived]
+    if not records:
+        return
+
+    stmt = dialect_insert()(Emission.__table__).on_conflict_do_nothing(index_elements=['user_id', 'date'])
+    db.session.execute(stmt, records)
+
+def upsert_emission(record):
+    """Insert or update a single day's emission row"""
+    upsert_emissions([record])
+
+def ensure_unique_day_index():
+    """Create the (user_id, date) unique index on databases created before it existed
+
+    Duplicate days left behind by the old read-then-write path are removed first,
+    keeping the most recently inserted row for each day.
+    """
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(Emission.__tablename__)}
+    if UNIQUE_DAY_INDEX in existing:
+        return
+
+    latest_ids = select(func.max(Emission.id)).group_by(Emission.user_id, Emission.date)
+    db.session.execute(delete(Emission).where(Emission.id.not_in(latest_ids)))
+    db.session.commit()
+
+    index = next(ix for ix in Emission.__table__.indexes if ix.name == UNIQUE_DAY_INDEX)
+    index.create(db.engine)
+
+def ensure_added_columns():
+    """Add ADDED_COLUMNS and their indexes to emissions tables created before they existed
+
+    Existing rows are left NULL: factors unknown and raw diet/transport inputs not recorded.
+    """
+    table = Emission.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    missing = [name for name in ADDED_COLUMNS if name not in existing]
+    if not missing:
+        return
+
+    with db.engine.begin() as connection:
+        for name in missing:
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}'))
+    for index in table.indexes:
+        if set(index.columns.keys()) & set(missing):
+            index.create(db.engine)
@@ -0,0 +1,131 @@
+import io
+import csv
+import json
+import heapq
+from sqlalchemy import select
+from models import db, Emission
+from emission_store import appliance_usage_for, transport_legs_for
+from archive import archive_cutoff, emissions_archive
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 500
+
+# Rows serialized into each chunk sent to the client
+EXPORT_CHUNK_ROWS = 200
+
+# Exported columns, in output order
+EXPORT_COLUMNS = (
+    'date',
+    'total_emissions',
+    'transport_total',
+    'electricity_total',
+    'diet_total',
+    'gas_total',
+    'waste_total',
+    'water_total',
+    'transport_legs',
+    'appliance_usage',
+    'diet_type',
+    'diet_frequency',
+    'meat_types',
+    'gas_usage',
+    'waste_amount',
+    'waste_recycled',
+    'water_usage',
+    'factor_version',
+    'created_at',
+)
+
+# Exported columns holding lists, written to CSV cells as JSON
+EXPORT_LIST_COLUMNS = ('transport_legs', 'appliance_usage', 'meat_types')
+
+# Exported columns read straight from the emissions table; the rest come from child rows
+EMISSION_COLUMNS = tuple(col for col in EXPORT_COLUMNS if col != 'transport_legs')
+
+def iter_user_emissions(user_id):
+    """Stream a user's emission rows, archived days included, in date order
+
+    Once anything has been archived, the hot and archived rows are merged from
+    two server-side cursors. A day in both (while its batch is being moved) is
+    exported once, from the hot table.
+    """
+    records = _iter_hot_emissions(user_id)
+    if archive_cutoff() is None:
+        yield from records
+        return
+
+    previous = None
+    for record in heapq.merge(records, _iter_archived_emissions(user_id), key=lambda record: record['date']):
+        if record['date'] != previous:
+            yield record
+        previous = record['date']
+
+def _iter_archived_emissions(user_id):
+    """Stream a user's archived rows in date order"""
+    archive = emissions_archive.c
+    stmt = select(*[archive[col] for col in EXPORT_COLUMNS])\
+        .where(archive.user_id == user_id)\
+        .order_by(archive.date.asc())
+    for row in db.session.execute(stmt, execution_options={'yield_per': EXPORT_FETCH_SIZE}):
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record['transport_legs'] = record['transport_legs'] or []
+        record['appliance_usage'] = record['appliance_usage'] or []
+        yield record
+
+def _iter_hot_emissions(user_id):
+    """Stream a user's rows from the emissions table in date order from a server-side cursor
+
+    Transport legs and appliance usage are loaded from their child tables once
+    per fetched batch, appliance usage falling back to the legacy JSON copy for
+    rows not yet migrated.
+    """
+    stmt = select(Emission.id, *[getattr(Emission, col) for col in EMISSION_COLUMNS])\
+        .where(Emission.user_id == user_id)\
+        .order_by(Emission.date.asc())
+    result = db.session.execute(stmt, execution_options={'yield_per': EXPORT_FETCH_SIZE})
+
+    for partition in result.partitions():
+        emission_ids = [row.id for row in partition]
+        usage = appliance_usage_for(emission_ids)
+        legs = transport_legs_for(emission_ids)
+        for row in partition:
+            record = dict(zip(EMISSION_COLUMNS, row[1:]))
+            record['transport_legs'] = legs.get(row.id, [])
+            record['appliance_usage'] = usage.get(row.id, record['appliance_usage'] or [])
+            yield {col: record[col] for col in EXPORT_COLUMNS}
+
+def _export_value(value):
+    """Convert a column value to its JSON-friendly export form"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def generate_csv(user_id):
+    """Yield a user's history as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for count, record in enumerate(iter_user_emissions(user_id), 1):
+        writer.writerow([json.dumps(record[col] or []) if col in EXPORT_LIST_COLUMNS else _export_value(record[col])
+                         for col in EXPORT_COLUMNS])
+
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def generate_ndjson(user_id):
+    """Yield a user's history as newline-delimited JSON chunks"""
+    lines = []
+    for record in iter_user_emissions(user_id):
+        lines.append(json.dumps({col: _export_value(value) for col, value in record.items()}))
+
+        if len(lines) == EXPORT_CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,153 @@
+import logging
+from numbers import Real
+from types import MappingProxyType
+from reloading import ReloadingJSONFile
+
+# Factors used when the factors file is missing or unreadable
+DEFAULT_FACTOR_VERSION = 1
+DEFAULT_EMISSION_FACTORS = {
+    'transportation': {
+        'Car': {'Petrol': 0.24, 'Diesel': 0.27, 'CNG': 0.18, 'Electric': 0.05},
+        'Bike': {'Petrol': 0.08, 'Electric': 0.02},
+        'Bus': {'Diesel': 0.10, 'CNG': 0.08, 'Electric': 0.04},
+        'Train': {'Electric': 0.04, 'Diesel': 0.06},
+        'Plane': {'Jet Fuel': 0.25},
+        'Walking': {'None': 0.0}
+    },
+    'appliances': {
+        'AC': 1.5,  # kWh per hour
+        'Fan': 0.05,
+        'Fridge': 0.15,
+        'Washing Machine': 0.5,
+        'Heater': 2.0,
+        'TV': 0.1
+    },
+    'electricity': 0.5,  # kg CO2 per kWh
+    'diet': {
+        'Chicken': 0.6,  # kg CO2 per 100g
+        'Beef': 2.7,
+        'Pork': 1.2,
+        'Fish': 0.5,
+        'Mutton': 2.4,
+        'Vegetarian': 0.1
+    },
+    'gas': 2.98,  # kg CO2 per kg LPG
+    'waste': {
+        'recycled': 0.1,  # kg CO2 per kg waste
+        'not_recycled': 0.5
+    },
+    'water': 0.0003  # kg CO2 per liter
+}
+
+def _check_factor(value, path):
+    if isinstance(value, bool) or not isinstance(value, Real) or value < 0:
+        raise ValueError(f"{path} must be a non-negative number")
+
+def _check_table(value, path):
+    if not isinstance(value, dict) or not value:
+        raise ValueError(f"{path} must be a non-empty object")
+    for key, factor in value.items():
+        _check_factor(factor, f"{path}.{key}")
+
+def validate_factors(factors):
+    """Raise ValueError unless `factors` has the shape of DEFAULT_EMISSION_FACTORS"""
+    if not isinstance(factors, dict):
+        raise ValueError("factors must be an object")
+    missing = set(DEFAULT_EMISSION_FACTORS) - set(factors)
+    if missing:
+        raise ValueError(f"factors is missing {', '.join(sorted(missing))}")
+
+    if not isinstance(factors['transportation'], dict) or not factors['transportation']:
+        raise ValueError("transportation must be a non-empty object")
+    for vehicle, fuels in factors['transportation'].items():
+        _check_table(fuels, f"transportation.{vehicle}")
+    _check_table(factors['appliances'], 'appliances')
+    _check_table(factors['diet'], 'diet')
+    _check_table(factors['waste'], 'waste')
+    if 'Vegetarian' not in factors['diet']:
+        raise ValueError("diet.Vegetarian is required")
+    for key in ('recycled', 'not_recycled'):
+        if key not in factors['waste']:
+            raise ValueError(f"waste.{key} is required")
+    for key in ('electricity', 'gas', 'water'):
+        _check_factor(factors[key], key)
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    return value
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    return value
+
+class FactorSet:
+    """One immutable, versioned set of emission factors
+
+    `factors` is a read-only nested mapping with the same shape as
+    DEFAULT_EMISSION_FACTORS. The flattened lookup tables for batch calculations
+    are compiled on first use and kept with the set they were built from.
+    """
+
+    def __init__(self, version, factors):
+        if isinstance(version, bool) or not isinstance(version, int) or version < 1:
+            raise ValueError("version must be a positive integer")
+        validate_factors(factors)
+        self.version = version
+        self.factors = _freeze(factors)
+        self.vehicle_fuels = MappingProxyType({vehicle: tuple(fuels)
+                                               for vehicle, fuels in factors['transportation'].items()})
+        self._tables = None
+
+    @property
+    def tables(self):
+        """Flattened lookup tables for calculate_batch, built on first use"""
+        if self._tables is None:
+            from batch_calculator import FactorTables
+            self._tables = FactorTables(self.factors, self.version)
+        return self._tables
+
+    def as_dict(self):
+        """Return the factors as plain nested dictionaries"""
+        return _thaw(self.factors)
+
+    def __repr__(self):
+        return f'<FactorSet v{self.version}>'
+
+class FactorRegistry(ReloadingJSONFile):
+    """Serves the current FactorSet, re-reading the factors file only when its mtime changes
+
+    The file holds {"version": <int>, "factors": {...}}. A new set is compiled
+    completely before it replaces the current one, so a request that took a set
+    from current() never sees a mix of versions. Files that fail validation,
+    lower the version, or change factors without raising it are logged and
+    ignored.
+    """
+
+    description = 'emission factors'
+
+    def __init__(self, path, check_interval=5.0):
+        super().__init__(path, check_interval)
+        self._current = FactorSet(DEFAULT_FACTOR_VERSION, DEFAULT_EMISSION_FACTORS)
+
+    def apply(self, document):
+        """Replace the current set with the file's if its version is newer"""
+        factor_set = FactorSet(document['version'], document['factors'])
+        current = self._current
+        if factor_set.version < current.version:
+            logging.error(f"Ignoring emission factors version {factor_set.version}, "
+                          f"older than loaded version {current.version}")
+            return
+        if factor_set.version == current.version and factor_set.factors != current.factors:
+            logging.error(f"Ignoring emission factors changed without raising version {current.version}")
+            return
+
+        if factor_set.version > current.version:
+            logging.info(f"Loaded emission factors version {factor_set.version}")
+            self._current = factor_set
+
+    def current(self):
+        """Return the current FactorSet"""
+        self.refresh()
+        return self._current
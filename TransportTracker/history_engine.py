@@ -0,0 +1,155 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from models import db, Emission, EmissionRollup
+from archive import archive_cutoff, with_archived
+
+# Number of table rows shown per history page
+HISTORY_PAGE_SIZE = 50
+
+# Number of most recent entries plotted on the trend chart
+CHART_WINDOW = 30
+
+# Columns needed to render a history table row (skips the JSON blobs)
+HISTORY_COLUMNS = (
+    Emission.date,
+    Emission.total_emissions,
+    Emission.transport_total,
+    Emission.electricity_total,
+    Emission.diet_total,
+    Emission.gas_total,
+    Emission.waste_total,
+    Emission.water_total,
+)
+
+def parse_cursor(value):
+    """Parse a YYYY-MM-DD pagination cursor, returning None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def row_to_entry(row):
+    """Convert a history column row to the dictionary shape used by the templates"""
+    return {
+        'date': row.date.strftime('%Y-%m-%d'),
+        'total': row.total_emissions,
+        'transportation': row.transport_total,
+        'electricity': row.electricity_total,
+        'diet': row.diet_total,
+        'gas': row.gas_total,
+        'waste': row.waste_total,
+        'water': row.water_total,
+    }
+
+def get_summary(user_id):
+    """Compute entry count and average/highest/lowest daily totals from the monthly rollups
+
+    Also returns `last_updated`, the time the user's rollups last changed, which
+    moves on every saved day and serves as the history page's Last-Modified.
+    """
+    total_entries, total_sum, highest_day, lowest_day, last_updated = db.session.query(
+        func.sum(EmissionRollup.entry_count),
+        func.sum(EmissionRollup.total_emissions),
+        func.max(EmissionRollup.max_total),
+        func.min(EmissionRollup.min_total),
+        func.max(EmissionRollup.updated_at),
+    ).filter(EmissionRollup.user_id == user_id,
+             EmissionRollup.period == 'month').one()
+
+    total_entries = total_entries or 0
+    average_daily = total_sum / total_entries if total_entries > 0 else 0
+
+    return {
+        'total_entries': total_entries,
+        'average_daily': round(average_daily, 2),
+        'highest_day': round(highest_day or 0, 2),
+        'lowest_day': round(lowest_day or 0, 2),
+        'last_updated': last_updated,
+    }
+
+def _may_have_archived(user_id, cutoff, after=None, before=None):
+    """Whether the user's monthly rollups show entries that can be in the archive
+
+    Only days before `cutoff` are archived, and rollups keep counting them, so a
+    user with no rollup month starting before it has nothing archived. `after`
+    and `before` narrow the check to a page's date range.
+    """
+    if cutoff is None:
+        return False
+    query = db.session.query(EmissionRollup.id)\
+                      .filter(EmissionRollup.user_id == user_id,
+                              EmissionRollup.period == 'month',
+                              EmissionRollup.entry_count > 0,
+                              EmissionRollup.period_start < (min(cutoff, before) if before is not None else cutoff))
+    if after is not None:
+        query = query.filter(EmissionRollup.period_start >= after.replace(day=1))
+    return db.session.query(query.exists()).scalar()
+
+def _history_rows(user_id, criteria, newest_first, limit, cutoff):
+    """Fetch history rows from the hot table and archived days, in date order"""
+    stmt = with_archived([col.key for col in HISTORY_COLUMNS],
+                         lambda c: (c.user_id == user_id,) + criteria(c), cutoff).subquery()
+    order = stmt.c.date.desc() if newest_first else stmt.c.date.asc()
+    return db.session.execute(select(stmt).order_by(order).limit(limit)).all()
+
+def get_chart_window(user_id, limit=CHART_WINDOW):
+    """Fetch the most recent entries for the trend chart, oldest first
+
+    Archived days are only read when the hot table cannot fill the window on
+    its own and the user's rollups show days old enough to be archived.
+    """
+    rows = db.session.query(Emission.date, Emission.total_emissions)\
+                     .filter(Emission.user_id == user_id)\
+                     .order_by(Emission.date.desc())\
+                     .limit(limit).all()
+    cutoff = archive_cutoff()
+    if (cutoff is not None and (len(rows) < limit or rows[-1].date < cutoff)
+            and _may_have_archived(user_id, cutoff)):
+        rows = _history_rows(user_id, lambda c: (), True, limit, cutoff)
+    rows.reverse()
+
+    dates = [row.date.strftime('%Y-%m-%d') for row in rows]
+    totals = [row.total_emissions for row in rows]
+    return dates, totals
+
+def get_page(user_id, before=None, after=None, page_size=HISTORY_PAGE_SIZE):
+    """Fetch one page of history rows, newest first, using keyset pagination on (user_id, date)
+
+    `before` returns the page of entries older than that date, `after` the page
+    of entries newer than it. With neither, the newest page is returned.
+    Archived days (all older than the archive cutoff) are only read when the
+    page reaches back past the cutoff and the user's rollups show entries there.
+    """
+    query = db.session.query(*HISTORY_COLUMNS).filter(Emission.user_id == user_id)
+    cutoff = archive_cutoff()
+
+    if after is not None:
+        rows = query.filter(Emission.date > after)\
+                    .order_by(Emission.date.asc())\
+                    .limit(page_size + 1).all()
+        if cutoff is not None and after < cutoff and _may_have_archived(user_id, cutoff, after=after):
+            rows = _history_rows(user_id, lambda c: (c.date > after,), False, page_size + 1, cutoff)
+        has_newer = len(rows) > page_size
+        rows = list(reversed(rows[:page_size]))
+        has_older = True
+    else:
+        if before is not None:
+            query = query.filter(Emission.date < before)
+        rows = query.order_by(Emission.date.desc()).limit(page_size + 1).all()
+        if (cutoff is not None and (len(rows) <= page_size or rows[-1].date < cutoff)
+                and _may_have_archived(user_id, cutoff, before=before)):
+            criteria = (lambda c: (c.date < before,)) if before is not None else (lambda c: ())
+            rows = _history_rows(user_id, criteria, True, page_size + 1, cutoff)
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = before is not None
+
+    entries = [row_to_entry(row) for row in rows]
+
+    return {
+        'entries': entries,
+        'newer_cursor': entries[0]['date'] if entries and has_newer else None,
+        'older_cursor': entries[-1]['date'] if entries and has_older else None,
+    }
@@ -0,0 +1,62 @@
+import os
+import hashlib
+from flask import current_app, jsonify, request, session
+from werkzeug.http import is_resource_modified
+from assets import manifest_digest
+
+# Lifetime of reference-data responses requested with the current factor version (?v=<version>)
+REFERENCE_MAX_AGE = 86400
+
+_template_digests = {}
+
+def template_digest():
+    """Digest of the app's template sources, so rendered-page ETags change with a deploy"""
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    if folder not in _template_digests:
+        digest = hashlib.sha1()
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+        _template_digests[folder] = digest.hexdigest()
+    return _template_digests[folder]
+
+def reference_response(payload, version):
+    """JSON response for factor reference data with a content-hash ETag and public caching
+
+    Only a URL naming the current factor `version` (?v=<version>) may be reused
+    for REFERENCE_MAX_AGE; any other URL must be revalidated on every use, so a
+    hot-reloaded factor set is picked up at once. Returns 304 Not Modified when
+    the client's If-None-Match already matches.
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.public = True
+    if request.args.get('v') == str(version):
+        response.cache_control.max_age = REFERENCE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def page_etag(*parts):
+    """Strong ETag for a rendered per-user page from the values it depends on"""
+    key = '\0'.join(str(part) for part in (template_digest(), manifest_digest(), request.full_path) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def page_not_modified(etag, last_modified):
+    """Whether the client's cached copy of a page is current
+
+    Pending flash messages always force a fresh render so they are shown and consumed.
+    """
+    if session.get('_flashes'):
+        return False
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def private_cache(response, etag, last_modified):
+    """Attach validators to a per-user page and require revalidation on every use"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
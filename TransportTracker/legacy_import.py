@@ -0,0 +1,132 @@
+import json
+import logging
+from datetime import datetime
+from emission_store import insert_missing_emissions, upsert_emissions
+from rollups import refresh_rollups
+from models import db
+
+# Legacy records written per bulk insert and commit
+IMPORT_BATCH_SIZE = 1000
+
+# Bytes read from the legacy file at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+# Legacy flat keys mapped onto Emission columns
+LEGACY_COLUMNS = {
+    'transportation': 'transport_total',
+    'electricity': 'electricity_total',
+    'diet': 'diet_total',
+    'gas': 'gas_total',
+    'waste': 'waste_total',
+    'water': 'water_total',
+}
+
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array one at a time
+
+    Only the current chunk and the element being decoded are held in memory,
+    so arbitrarily large dumps can be read.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and separators between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Legacy file must contain a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number is only complete once a delimiter follows it
+                complete = end < len(buffer) and buffer[end] in ' \t\r\n,]'
+                if complete or eof or isinstance(element, (dict, list, str)):
+                    yield element
+                    position = end
+                    continue
+
+        if eof:
+            if started:
+                raise ValueError("Unexpected end of legacy file")
+            return
+
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def legacy_record_to_row(record, user_id):
+    """Map a legacy data/emissions.json record onto Emission columns"""
+    breakdown = record.get('breakdown') or {}
+    row = {
+        'user_id': user_id,
+        'date': datetime.strptime(record['date'], '%Y-%m-%d').date(),
+        'total_emissions': float(record.get('total') or 0),
+        'diet_type': None,
+        'gas_usage': 0.0,
+        'waste_amount': 0.0,
+        'waste_recycled': False,
+        'water_usage': 0.0,
+        'created_at': datetime.fromisoformat(record['timestamp']) if record.get('timestamp') else datetime.utcnow(),
+    }
+    for legacy_key, column in LEGACY_COLUMNS.items():
+        # Older records only kept the breakdown, sometimes with capitalized keys
+        value = record.get(legacy_key, breakdown.get(legacy_key, breakdown.get(legacy_key.capitalize(), 0)))
+        row[column] = float(value or 0)
+    return row
+
+def import_legacy_emissions(path, user_id, overwrite=False, progress=None):
+    """Import a legacy emissions JSON dump for one user in batched bulk inserts
+
+    Days that already exist for the user are skipped unless `overwrite` is set,
+    so re-running an import is harmless. `progress` is called with the running
+    count after each committed batch. Returns (processed, skipped_invalid).
+    """
+    write = upsert_emissions if overwrite else insert_missing_emissions
+    processed = 0
+    invalid = 0
+    batch = {}
+
+    def flush():
+        rows = list(batch.values())
+        write(rows)
+        refresh_rollups((row['user_id'], row['date']) for row in rows)
+        db.session.commit()
+        batch.clear()
+        if progress:
+            progress(processed)
+
+    with open(path, 'r') as f:
+        for index, record in enumerate(iter_json_array(f)):
+            try:
+                row = legacy_record_to_row(record, user_id)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                invalid += 1
+                logging.warning(f"Skipping legacy record {index}: {str(e)}")
+                continue
+
+            # Later records for the same day replace earlier ones
+            batch[row['date']] = row
+            processed += 1
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+
+    if batch:
+        flush()
+
+    return processed, invalid
@@ -1,7 +1,8 @@
-from app import app
-from models import db
+from app import create_app, init_db
+
+app = create_app()
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,173 @@
+import time
+import threading
+from functools import wraps
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from models import db
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for the number of SQL statements issued by one request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _format_labels(names, values, extra=()):
+    """Render a Prometheus label set"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+class Histogram:
+    """Cumulative bucket histogram keyed by label values"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {count}')
+        return lines
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route', ('endpoint', 'method'))
+REQUEST_COUNT = Counter('http_requests_total', 'Requests by route and status', ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram('db_queries_per_request', 'SQL statements issued per request', ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('db_time_per_request_seconds', 'Cumulative SQL time per request', ('endpoint',))
+FUNCTION_DURATION = Histogram('function_duration_seconds', 'Time spent in instrumented functions', ('function',))
+TEMPLATE_RENDER = Histogram('template_render_seconds', 'Template rendering time', ('template',))
+
+REGISTRY = (REQUEST_LATENCY, REQUEST_COUNT, REQUEST_QUERIES, REQUEST_DB_TIME, FUNCTION_DURATION, TEMPLATE_RENDER)
+
+# Set by init_metrics(); instrumented functions skip all timing while False
+_enabled = False
+
+def timed(f):
+    """Record the wrapped function's duration when metrics are enabled"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return f(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            FUNCTION_DURATION.observe((f.__name__,), time.perf_counter() - start)
+    return wrapper
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None or request.endpoint == 'metrics':
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.observe((endpoint, request.method), time.perf_counter() - start)
+    REQUEST_COUNT.inc((endpoint, request.method, response.status_code))
+    REQUEST_QUERIES.observe((endpoint,), g.pop('metrics_queries', 0))
+    REQUEST_DB_TIME.observe((endpoint,), g.pop('metrics_db_time', 0.0))
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += elapsed
+
+def _handle_db_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_query_start'):
+        connection.info['metrics_query_start'].pop()
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('metrics_render_starts', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    starts = g.get('metrics_render_starts')
+    if starts:
+        TEMPLATE_RENDER.observe((template.name,), time.perf_counter() - starts.pop())
+
+def metrics_view():
+    """Expose all metrics in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """Install request, SQL and template instrumentation and the /metrics endpoint
+
+    Nothing is registered when METRICS_ENABLED is false, so a disabled app pays
+    only a flag check inside @timed functions.
+    """
+    global _enabled
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    _enabled = True
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_db_error)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
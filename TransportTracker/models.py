@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, password_needs_rehash
 from datetime import datetime
 from flask_login import UserMixin
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Sessions route read-only queries to replicas where a route allows it (see replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -18,18 +20,29 @@ class User(UserMixin, db.Model):
     emissions = db.relationship('Emission', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set the password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set the password using the configured method and cost"""
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def rehash_password_if_needed(self, password):
+        """Re-hash a verified password if the hash parameters changed; returns True if updated"""
+        if not password_needs_rehash(self.password_hash):
+            return False
+        self.set_password(password)
+        return True
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class Emission(db.Model):
     __tablename__ = 'emissions'
+    __table_args__ = (
+        # One entry per user per day; also serves history lookups by date
+        db.Index('ix_emissions_user_date', 'user_id', 'date', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -40,14 +53,20 @@ class Emission(db.Model):
     transport_vehicle = db.Column(db.String(50))
     transport_fuel = db.Column(db.String(50))
     transport_distance = db.Column(db.Float, default=0.0)
+    transport_legs = db.relationship('EmissionTransport', backref='emission', lazy=True,
+                                     cascade='all, delete-orphan', order_by='EmissionTransport.id')
     
     # Electricity
     electricity_total = db.Column(db.Float, default=0.0)
-    appliance_usage = db.Column(db.JSON)  # Store appliance data as JSON
+    appliance_usage = db.Column(db.JSON)  # Legacy JSON copy; converted into EmissionAppliance rows by `flask migrate-appliances`
+    appliances = db.relationship('EmissionAppliance', backref='emission', lazy=True,
+                                 cascade='all, delete-orphan', order_by='EmissionAppliance.id')
     
     # Diet
     diet_total = db.Column(db.Float, default=0.0)
     diet_type = db.Column(db.String(50))
+    diet_frequency = db.Column(db.Float)  # NULL on rows saved before raw diet and transport inputs were recorded
+    meat_types = db.Column(db.JSON)
     
     # Gas
     gas_total = db.Column(db.Float, default=0.0)
@@ -64,6 +83,7 @@ class Emission(db.Model):
     
     # Totals
     total_emissions = db.Column(db.Float, nullable=False)
+    factor_version = db.Column(db.Integer, index=True)  # Factor set the totals were computed with; NULL if unknown
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -92,4 +112,106 @@ class Emission(db.Model):
         }
     
     def __repr__(self):
-        return f'<Emission {self.date} - {self.total_emissions}kg CO2>'
\ No newline at end of file
+        return f'<Emission {self.date} - {self.total_emissions}kg CO2>'
+
+class EmissionAppliance(db.Model):
+    __tablename__ = 'emission_appliances'
+    __table_args__ = (
+        # Serves per-appliance reports; the emission_id index serves per-day lookups
+        db.Index('ix_emission_appliances_appliance', 'appliance', 'emission_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    emission_id = db.Column(db.Integer, db.ForeignKey('emissions.id', ondelete='CASCADE'), nullable=False, index=True)
+    appliance = db.Column(db.String(50), nullable=False)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def to_dict(self):
+        """Convert to the {'appliance', 'hours'} shape used by the calculation functions"""
+        return {'appliance': self.appliance, 'hours': self.hours}
+    
+    def __repr__(self):
+        return f'<EmissionAppliance {self.appliance} {self.hours}h>'
+
+class EmissionTransport(db.Model):
+    __tablename__ = 'emission_transport'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    emission_id = db.Column(db.Integer, db.ForeignKey('emissions.id', ondelete='CASCADE'), nullable=False, index=True)
+    vehicle = db.Column(db.String(50), nullable=False)
+    fuel = db.Column(db.String(50), nullable=False)
+    distance = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def to_dict(self):
+        """Convert to the {'vehicle', 'fuel', 'distance'} shape used by the calculation functions"""
+        return {'vehicle': self.vehicle, 'fuel': self.fuel, 'distance': self.distance}
+    
+    def __repr__(self):
+        return f'<EmissionTransport {self.vehicle}/{self.fuel} {self.distance}km>'
+
+class EmissionRollup(db.Model):
+    __tablename__ = 'emission_rollups'
+    __table_args__ = (
+        db.Index('ix_emission_rollups_user_period', 'user_id', 'period', 'period_start', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # 'week' or 'month'
+    period_start = db.Column(db.Date, nullable=False)  # Monday of the week / first of the month
+    
+    # Category sums over the period
+    transport_total = db.Column(db.Float, default=0.0)
+    electricity_total = db.Column(db.Float, default=0.0)
+    diet_total = db.Column(db.Float, default=0.0)
+    gas_total = db.Column(db.Float, default=0.0)
+    waste_total = db.Column(db.Float, default=0.0)
+    water_total = db.Column(db.Float, default=0.0)
+    total_emissions = db.Column(db.Float, default=0.0)
+    
+    # Daily entry statistics over the period
+    entry_count = db.Column(db.Integer, default=0)
+    min_total = db.Column(db.Float)
+    max_total = db.Column(db.Float)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EmissionRollup {self.user_id} {self.period} {self.period_start}>'
+
+class CohortBucket(db.Model):
+    __tablename__ = 'cohort_buckets'
+    __table_args__ = (
+        db.Index('ix_cohort_buckets_month_category', 'period_start', 'category', 'bucket', unique=True),
+    )
+    
+    # Number of users whose average daily emissions for the month fall into one histogram bucket
+    id = db.Column(db.Integer, primary_key=True)
+    period_start = db.Column(db.Date, nullable=False)  # First of the month
+    category = db.Column(db.String(20), nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CohortBucket {self.period_start} {self.category} #{self.bucket}: {self.user_count}>'
+
+class JobCheckpoint(db.Model):
+    __tablename__ = 'job_checkpoints'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # Highest row id fully processed
+    factor_version = db.Column(db.Integer)  # Factor version the job was computing with
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<JobCheckpoint {self.name} at {self.last_id}>'
+
+class ArchiveState(db.Model):
+    __tablename__ = 'archive_state'
+    
+    name = db.Column(db.String(50), primary_key=True)  # Archived table
+    archived_before = db.Column(db.Date, nullable=False)  # Rows dated before this may live in the archive
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchiveState {self.name} before {self.archived_before}>'
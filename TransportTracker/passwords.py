@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Prefixes of hashes produced by bcrypt ($2b$ is what the bcrypt package writes)
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+# Defaults used when the app config does not override them
+DEFAULT_HASH_METHOD = 'scrypt'
+DEFAULT_BCRYPT_ROUNDS = 12
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password hashing pool has no free capacity"""
+
+def _bcrypt_password(password):
+    # bcrypt only uses the first 72 bytes; truncate explicitly as newer releases reject longer input
+    return password.encode('utf-8')[:72]
+
+def generate_hash(password, method=DEFAULT_HASH_METHOD, bcrypt_rounds=DEFAULT_BCRYPT_ROUNDS):
+    """Hash a password with 'bcrypt' or any werkzeug method (e.g. 'scrypt', 'pbkdf2:sha256:600000')"""
+    if method == 'bcrypt':
+        import bcrypt
+        return bcrypt.hashpw(_bcrypt_password(password), bcrypt.gensalt(bcrypt_rounds)).decode('ascii')
+    return generate_password_hash(password, method=method)
+
+def verify_hash(stored, password):
+    """Check a password against a bcrypt or werkzeug hash"""
+    if stored.startswith(BCRYPT_PREFIXES):
+        import bcrypt
+        return bcrypt.checkpw(_bcrypt_password(password), stored.encode('ascii'))
+    return check_password_hash(stored, password)
+
+_method_prefixes = {}
+
+def hash_prefix(method, bcrypt_rounds):
+    """Return the parameter prefix every hash made with these settings starts with"""
+    if method == 'bcrypt':
+        return f'$2b${bcrypt_rounds:02d}$'
+    if method not in _method_prefixes:
+        # Werkzeug expands defaults into the prefix, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+        _method_prefixes[method] = generate_password_hash('', method=method).split('$', 1)[0] + '$'
+    return _method_prefixes[method]
+
+def needs_rehash(stored, method, bcrypt_rounds):
+    """Whether a stored hash was made with a different method or cost than configured"""
+    return not stored.startswith(hash_prefix(method, bcrypt_rounds))
+
+class PasswordHashingPool:
+    """Bounded thread or process pool for CPU-bound hashing work
+
+    At most `workers` hashes run at once and `queue_size` more may wait. Further
+    requests fail fast with PasswordPoolBusy instead of tying up the worker.
+    """
+
+    def __init__(self, workers, kind='thread', queue_size=None, timeout=10.0):
+        executor_class = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+        self._executor = executor_class(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + (workers if queue_size is None else queue_size))
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash finishes, even if this caller stops waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordPoolBusy()
+
+def _settings():
+    config = current_app.config
+    return (config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD),
+            config.get('PASSWORD_BCRYPT_ROUNDS', DEFAULT_BCRYPT_ROUNDS))
+
+def _run(fn, *args):
+    pool = current_app.extensions.get('password_pool')
+    return pool.run(fn, *args) if pool else fn(*args)
+
+def hash_password(password):
+    """Hash a password with the configured method, on the hashing pool when enabled"""
+    method, bcrypt_rounds = _settings()
+    return _run(generate_hash, password, method, bcrypt_rounds)
+
+def verify_password(stored, password):
+    """Verify a password, on the hashing pool when enabled"""
+    return _run(verify_hash, stored, password)
+
+def password_needs_rehash(stored):
+    """Whether a stored hash should be upgraded to the configured parameters"""
+    return needs_rehash(stored, *_settings())
+
+def init_password_hashing(app):
+    """Create the hashing pool when PASSWORD_POOL_WORKERS is set"""
+    workers = app.config.get('PASSWORD_POOL_WORKERS', 0)
+    if workers:
+        app.extensions['password_pool'] = PasswordHashingPool(
+            workers,
+            kind=app.config.get('PASSWORD_POOL_KIND', 'thread'),
+            queue_size=app.config.get('PASSWORD_POOL_QUEUE'),
+            timeout=app.config.get('PASSWORD_POOL_TIMEOUT', 10.0),
+        )
@@ -0,0 +1,227 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import bindparam, or_, update
+from models import db, Emission, JobCheckpoint
+from emission_store import appliance_usage_for, transport_legs_for
+from rollups import refresh_rollups
+
+# Checkpoint names for the two job modes
+RECOMPUTE_STALE_JOB = 'recompute-emissions'
+RECOMPUTE_ALL_JOB = 'recompute-emissions-all'
+
+# Stored category totals, as named on Emission rows
+TOTAL_COLUMNS = ('transport_total', 'electricity_total', 'diet_total', 'gas_total', 'waste_total', 'water_total')
+
+# Columns read for each row: identity, the values the write-back is conditional on, and raw inputs
+SOURCE_COLUMNS = (
+    Emission.id,
+    Emission.user_id,
+    Emission.date,
+    Emission.factor_version,
+    Emission.total_emissions,
+    *[getattr(Emission, col) for col in TOTAL_COLUMNS],
+    Emission.appliance_usage,
+    Emission.diet_type,
+    Emission.diet_frequency,
+    Emission.meat_types,
+    Emission.gas_usage,
+    Emission.waste_amount,
+    Emission.waste_recycled,
+    Emission.water_usage,
+)
+
+def read_chunk(last_id, chunk_size, version, recompute_all):
+    """Read the next chunk of rows after `last_id` as calculation records
+
+    Without `recompute_all` only rows calculated with another factor version
+    (or an unknown one) are returned.
+    """
+    query = db.session.query(*SOURCE_COLUMNS).filter(Emission.id > last_id)
+    if not recompute_all:
+        query = query.filter(or_(Emission.factor_version.is_(None), Emission.factor_version != version))
+    rows = query.order_by(Emission.id).limit(chunk_size).all()
+
+    emission_ids = [row.id for row in rows]
+    appliances = appliance_usage_for(emission_ids)
+    legs = transport_legs_for(emission_ids)
+
+    chunk = []
+    for row in rows:
+        chunk.append({
+            'id': row.id,
+            'factor_version': row.factor_version,
+            'total_emissions': row.total_emissions,
+            'stored': {col: getattr(row, col) or 0.0 for col in TOTAL_COLUMNS},
+            'record': {
+                'user_id': row.user_id,
+                'date': row.date.isoformat(),
+                'transport': legs.get(row.id, []),
+                'appliances': appliances.get(row.id, row.appliance_usage or []),
+                'diet': {'type': row.diet_type, 'frequency': row.diet_frequency,
+                         'meat_types': row.meat_types or []},
+                'gas_usage': row.gas_usage,
+                'waste_amount': row.waste_amount,
+                'recycles': row.waste_recycled,
+                'water_usage': row.water_usage,
+            },
+        })
+    return chunk
+
+def recorded_inputs(record):
+    """Return the total columns whose raw inputs are present in a record
+
+    Categories without inputs keep their stored total: a zero input always gives
+    zero, and rows imported or saved before an input was recorded have totals
+    that cannot be derived from the row.
+    """
+    present = {
+        'transport_total': record['transport'],
+        'electricity_total': record['appliances'],
+        'diet_total': record['diet']['frequency'],
+        'gas_total': record['gas_usage'],
+        'waste_total': record['waste_amount'],
+        'water_total': record['water_usage'],
+    }
+    return {col for col, value in present.items() if value}
+
+_worker_tables = None
+
+def _init_worker(factors, version):
+    """Compile the factor tables once in each pool process"""
+    global _worker_tables
+    from batch_calculator import FactorTables
+    _worker_tables = FactorTables(factors, version)
+
+def recompute_chunk(chunk, tables=None):
+    """Recalculate a chunk from read_chunk; returns (update parameters for rows that changed, rows skipped)
+
+    A row with a non-zero total whose inputs were not recorded cannot be fully
+    recalculated, and neither can one whose stored inputs fail validation; both
+    are skipped and keep their totals and factor version.
+    Runs in a pool process (using the tables from _init_worker) or inline with `tables`.
+    """
+    from batch_calculator import BatchInputError, calculate_batch
+    tables = tables or _worker_tables
+
+    chunk = list(chunk)
+    skipped = 0
+    while True:
+        try:
+            results = calculate_batch([item['record'] for item in chunk], tables)
+            break
+        except BatchInputError as e:
+            del chunk[e.index]
+            skipped += 1
+    by_key = {(row['user_id'], row['date'].isoformat()): row for row in results}
+
+    updates = []
+    for item in chunk:
+        row = by_key[(item['record']['user_id'], item['record']['date'])]
+        recorded = recorded_inputs(item['record'])
+        if any(item['stored'][col] and col not in recorded for col in TOTAL_COLUMNS):
+            skipped += 1
+            continue
+        totals = {col: row[col] if col in recorded else item['stored'][col] for col in TOTAL_COLUMNS}
+        total_emissions = round(sum(totals.values()), 2)
+
+        if (totals == item['stored'] and total_emissions == item['total_emissions']
+                and item['factor_version'] == tables.version):
+            continue
+        updates.append(dict(totals,
+                            total_emissions=total_emissions,
+                            factor_version=tables.version,
+                            b_id=item['id'],
+                            b_version=item['factor_version'],
+                            b_total=item['total_emissions'],
+                            user_id=row['user_id'],
+                            date=row['date']))
+    return updates, skipped
+
+# Write-back that only applies while the row still holds what was read, so days
+# re-saved by live traffic in the meantime are left alone
+_update_stmt = update(Emission.__table__)\
+    .where(Emission.__table__.c.id == bindparam('b_id'),
+           Emission.__table__.c.total_emissions == bindparam('b_total'),
+           Emission.__table__.c.factor_version.is_not_distinct_from(bindparam('b_version')))\
+    .values({col: bindparam(col) for col in TOTAL_COLUMNS + ('total_emissions', 'factor_version')})
+
+def write_chunk(updates, job_name, last_id, version):
+    """Write one chunk's updates, its rollups and the job checkpoint in a single short transaction"""
+    if updates:
+        params = [{key: value for key, value in update_row.items() if key not in ('user_id', 'date')}
+                  for update_row in updates]
+        db.session.execute(_update_stmt, params)
+        refresh_rollups((update_row['user_id'], update_row['date']) for update_row in updates)
+
+    checkpoint = db.session.get(JobCheckpoint, job_name) or JobCheckpoint(name=job_name)
+    checkpoint.last_id = last_id
+    checkpoint.factor_version = version
+    db.session.add(checkpoint)
+    db.session.commit()
+
+def recompute_emissions(factor_set, recompute_all=False, chunk_size=500, workers=0, restart=False, progress=None):
+    """Recompute stored totals from raw inputs with `factor_set`, resuming from the last checkpoint
+
+    Rows are read in id order in chunks, each in its own brief read transaction,
+    calculated on a pool of `workers` processes (inline when 0) and written back
+    in order, one transaction per chunk. A checkpoint from a run with another
+    factor version is discarded. Returns (rows read, rows updated, rows skipped).
+    """
+    job_name = RECOMPUTE_ALL_JOB if recompute_all else RECOMPUTE_STALE_JOB
+    checkpoint = db.session.get(JobCheckpoint, job_name)
+    last_id = 0
+    if checkpoint and not restart and checkpoint.factor_version == factor_set.version:
+        last_id = checkpoint.last_id
+    db.session.rollback()
+
+    executor = None
+    if workers:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(factor_set.as_dict(), factor_set.version))
+    pending = deque()
+    read = updated = skipped = 0
+
+    def finish_oldest():
+        nonlocal updated, skipped
+        future, chunk_last_id = pending.popleft()
+        updates, chunk_skipped = future.result()
+        write_chunk(updates, job_name, chunk_last_id, factor_set.version)
+        updated += len(updates)
+        skipped += chunk_skipped
+        if progress:
+            progress(read, updated, skipped)
+
+    try:
+        while True:
+            chunk = read_chunk(last_id, chunk_size, factor_set.version, recompute_all)
+            # End the read transaction before computing so no locks or snapshots are held
+            db.session.rollback()
+            if not chunk:
+                break
+            read += len(chunk)
+            last_id = chunk[-1]['id']
+
+            if executor is None:
+                updates, chunk_skipped = recompute_chunk(chunk, factor_set.tables)
+                write_chunk(updates, job_name, last_id, factor_set.version)
+                updated += len(updates)
+                skipped += chunk_skipped
+                if progress:
+                    progress(read, updated, skipped)
+                continue
+
+            pending.append((executor.submit(recompute_chunk, chunk), last_id))
+            # Keep every worker busy with one chunk queued behind it
+            if len(pending) >= workers * 2:
+                finish_oldest()
+
+        while pending:
+            finish_oldest()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # A finished run starts from the beginning next time
+    db.session.query(JobCheckpoint).filter(JobCheckpoint.name == job_name).delete()
+    db.session.commit()
+    return read, updated, skipped
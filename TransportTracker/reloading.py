@@ -0,0 +1,53 @@
+import os
+import json
+import time
+import logging
+
+class ReloadingJSONFile:
+    """Base for values kept in memory from a JSON file, re-read only when its mtime changes
+
+    The mtime is checked at most once every `check_interval` seconds, and each
+    revision of the file is considered once, even if it is rejected. Subclasses
+    implement apply(document), raising ValueError, KeyError or TypeError for a
+    document they cannot use, and may override file_missing().
+    """
+
+    # Named in the error logged when the file cannot be read or applied
+    description = 'file'
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._mtime = None
+        self._next_check = 0.0
+
+    def load(self):
+        """Load the file if it changed since the last load"""
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            self._mtime = None
+            self.file_missing()
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+
+        try:
+            with open(self.path, 'r') as f:
+                self.apply(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Error loading {self.description}: {str(e)}")
+
+    def refresh(self):
+        """Reload the file if its check interval has passed"""
+        if time.monotonic() >= self._next_check:
+            self.load()
+
+    def apply(self, document):
+        """Take the values from a newly read document"""
+        raise NotImplementedError
+
+    def file_missing(self):
+        """Called when the file does not exist; the loaded values are kept by default"""
@@ -0,0 +1,100 @@
+import time
+import random
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+# Replica engines are registered as SQLAlchemy binds named replica_0, replica_1, ...
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Cookie-session key holding the time until which a client's reads stay on the primary
+STICKY_PRIMARY_KEY = '_db_primary_until'
+
+def parse_replica_urls(value):
+    """Return the list of replica URLs from a comma-separated string or a list"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [url.strip() for url in value if url.strip()]
+
+def configure_replicas(app):
+    """Register DATABASE_REPLICA_URLS as binds and mark writing clients sticky (before db.init_app)"""
+    urls = parse_replica_urls(app.config.get('DATABASE_REPLICA_URLS'))
+    if not urls:
+        return
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for index, url in enumerate(urls):
+        binds[f'{REPLICA_BIND_PREFIX}{index}'] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    @app.after_request
+    def stick_to_primary(response):
+        # The client's next requests read their own writes while replicas catch up
+        if g.get('db_wrote'):
+            session[STICKY_PRIMARY_KEY] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+def read_replica(view):
+    """Route the view's plain SELECTs to a replica for the rest of the request
+
+    Streamed responses keep the routing, since it is stored on `g`. Writes still
+    go to the primary, and so does every read after the first write.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_reads = 'replica'
+        return view(*args, **kwargs)
+    return wrapped
+
+@contextmanager
+def replica_reads():
+    """Route plain SELECTs inside the block to a replica (for CLI commands and jobs)"""
+    previous = g.get('db_reads')
+    g.db_reads = 'replica'
+    try:
+        yield
+    finally:
+        g.db_reads = previous
+
+def _replica_engine(engines):
+    """Return this request's replica engine, chosen once so its reads share one snapshot"""
+    key = g.get('db_replica')
+    if key is None:
+        keys = [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+        if not keys:
+            return None
+        key = g.db_replica = random.choice(keys)
+    return engines[key]
+
+def _reads_pinned_to_primary():
+    if g.get('db_wrote'):
+        return True
+    if has_request_context() and session.get(STICKY_PRIMARY_KEY, 0) > time.time():
+        return True
+    return False
+
+class RoutingSession(Session):
+    """Session sending read-only queries to a replica where the caller allows it
+
+    Everything else (flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, raw
+    SQL and any model with its own bind key) uses the bind Flask-SQLAlchemy
+    chooses, the primary by default. A write pins the rest of the request to
+    the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_app_context() or engine is not self._db.engines.get(None):
+            return engine
+
+        if self._flushing or getattr(clause, 'is_dml', False):
+            g.db_wrote = True
+            return engine
+        if g.get('db_reads') != 'replica' or not getattr(clause, 'is_select', False):
+            return engine
+        if getattr(clause, '_for_update_arg', None) is not None or _reads_pinned_to_primary():
+            return engine
+        return _replica_engine(self._db.engines) or engine
@@ -0,0 +1,57 @@
+from sqlalchemy import Float, cast, func, select, union_all
+from models import db, Emission, EmissionAppliance
+from archive import archive_cutoff, emissions_archive
+
+def month_bucket(column):
+    """SQL expression truncating a date column to its month as 'YYYY-MM'"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc('month', column), 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+def _archived_appliance_entries(appliance):
+    """Select (date, user_id, appliance, hours) from the JSON appliance lists of archived days
+
+    Days also present in the hot table (while a batch is being moved) are left
+    to the hot side, as in archive.with_archived().
+    """
+    archived = emissions_archive.c
+    if db.session.get_bind().dialect.name == 'postgresql':
+        item = func.json_array_elements(archived.appliance_usage).table_valued('value', joins_implicitly=True)
+        name = func.json_extract_path_text(item.c.value, 'appliance')
+        hours = cast(func.json_extract_path_text(item.c.value, 'hours'), Float)
+    else:
+        item = func.json_each(archived.appliance_usage).table_valued('value', joins_implicitly=True)
+        name = func.json_extract(item.c.value, '$.appliance')
+        hours = func.json_extract(item.c.value, '$.hours')
+
+    in_hot = select(Emission.id).where(Emission.user_id == archived.user_id, Emission.date == archived.date).exists()
+    query = select(archived.date, archived.user_id, name.label('appliance'), hours.label('hours'))\
+        .select_from(emissions_archive, item).where(~in_hot)
+    if appliance:
+        query = query.where(name == appliance)
+    return query
+
+def appliance_hours_by_month(appliance=None):
+    """Aggregate appliance hours per month across all users
+
+    Returns rows of (month, appliance, total_hours, users, entries), computed
+    entirely in SQL from the EmissionAppliance table and, once days have been
+    archived, the appliance lists of archived days.
+    """
+    entries = select(Emission.date, Emission.user_id, EmissionAppliance.appliance, EmissionAppliance.hours)\
+        .join(Emission, Emission.id == EmissionAppliance.emission_id)
+    if appliance:
+        entries = entries.where(EmissionAppliance.appliance == appliance)
+    if archive_cutoff() is not None:
+        entries = union_all(entries, _archived_appliance_entries(appliance))
+    entries = entries.subquery()
+
+    month = month_bucket(entries.c.date).label('month')
+    return db.session.query(
+        month,
+        entries.c.appliance,
+        func.sum(entries.c.hours),
+        func.count(func.distinct(entries.c.user_id)),
+        func.count(),
+    ).group_by(month, entries.c.appliance)\
+     .order_by(month, entries.c.appliance).all()
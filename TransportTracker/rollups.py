@@ -0,0 +1,181 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+from models import db, EmissionRollup
+from emission_store import dialect_insert
+from archive import archive_cutoff, with_archived
+from cohorts import month_rollups, update_cohort_sketches, rebuild_cohort_sketches
+
+PERIODS = ('week', 'month')
+
+# Category columns summed into each rollup row
+ROLLUP_SUM_COLUMNS = (
+    'transport_total',
+    'electricity_total',
+    'diet_total',
+    'gas_total',
+    'waste_total',
+    'water_total',
+    'total_emissions',
+)
+
+# Daily columns read to aggregate rollups
+DAILY_COLUMNS = ('user_id', 'date') + ROLLUP_SUM_COLUMNS
+
+# Rollup rows written per upsert statement during a rebuild
+REBUILD_BATCH_SIZE = 1000
+
+# First key of the PostgreSQL advisory locks taken per user while refreshing rollups
+ROLLUP_LOCK_CLASS = 5001
+
+def period_start(period, day):
+    """Return the first day of the week (Monday) or month containing `day`"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def period_end(period, start):
+    """Return the first day after the period beginning at `start`"""
+    if period == 'week':
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+def upsert_rollups(rows):
+    """Insert or replace rollup rows keyed on (user_id, period, period_start)"""
+    if not rows:
+        return
+
+    stmt = dialect_insert()(EmissionRollup.__table__)
+    update_columns = ROLLUP_SUM_COLUMNS + ('entry_count', 'min_total', 'max_total', 'updated_at')
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'period', 'period_start'],
+        set_={col: stmt.excluded[col] for col in update_columns}
+    )
+    db.session.execute(stmt, rows)
+
+def refresh_rollups(entries):
+    """Recompute the weekly and monthly rollups covering the given (user_id, date) pairs
+
+    Each affected period is re-aggregated from its (at most 31) daily rows, so
+    updates to an existing day keep min/max correct. Users sharing a period are
+    aggregated in one grouped query. Periods reaching back past the archive
+    cutoff include archived days. Users whose monthly rollup changed are moved
+    between cohort histogram buckets. The caller is responsible for committing.
+
+    The users are locked, and their monthly rollups read, before anything is
+    aggregated, so concurrent refreshes of the same user run one after the other.
+    """
+    targets = defaultdict(set)
+    for user_id, day in entries:
+        for period in PERIODS:
+            targets[(period, period_start(period, day))].add(user_id)
+    if not targets:
+        return
+
+    _lock_users(set().union(*targets.values()))
+    old_months = {}
+    for (period, start), user_ids in sorted(targets.items()):
+        if period == 'month':
+            old_months.update(month_rollups(start, user_ids, for_update=True))
+
+    cutoff = archive_cutoff()
+    rows = []
+    for (period, start), user_ids in targets.items():
+        end = period_end(period, start)
+        daily = with_archived(DAILY_COLUMNS,
+                              lambda c: (c.user_id.in_(user_ids), c.date >= start, c.date < end),
+                              cutoff if cutoff is not None and start < cutoff else None).subquery()
+        results = db.session.query(
+            daily.c.user_id,
+            func.count(),
+            func.min(daily.c.total_emissions),
+            func.max(daily.c.total_emissions),
+            *[func.sum(daily.c[col]) for col in ROLLUP_SUM_COLUMNS]
+        ).group_by(daily.c.user_id).all()
+
+        for user_id, entry_count, min_total, max_total, *totals in results:
+            row = _rollup_row(user_id, period, start)
+            row.update(zip(ROLLUP_SUM_COLUMNS, (total or 0.0 for total in totals)))
+            row.update(entry_count=entry_count, min_total=min_total, max_total=max_total)
+            rows.append(row)
+
+    upsert_rollups(rows)
+    update_cohort_sketches(old_months, {(row['user_id'], row['period_start']): row
+                                        for row in rows if row['period'] == 'month'})
+
+def _lock_users(user_ids):
+    """Hold a transaction-scoped lock on each user's rollups, taken in user order
+
+    PostgreSQL uses advisory locks, which also cover months without a rollup row
+    yet. SQLite needs none: the caller's write already holds the database lock.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for user_id in sorted(user_ids):
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:lock_class, :user_id)'),
+                           {'lock_class': ROLLUP_LOCK_CLASS, 'user_id': user_id})
+
+def _rollup_row(user_id, period, start):
+    """Create an empty rollup row dictionary"""
+    row = {col: 0.0 for col in ROLLUP_SUM_COLUMNS}
+    row.update(user_id=user_id, period=period, period_start=start,
+               entry_count=0, min_total=None, max_total=None,
+               updated_at=datetime.utcnow())
+    return row
+
+def rebuild_rollups(user_id=None):
+    """Backfill rollups from existing emission rows, archived ones included, for every user or a single one
+
+    Daily rows are streamed in (user_id, date) order and accumulated one user
+    at a time, so memory is bounded by a single user's periods. The cohort
+    histograms are then recounted from all monthly rollups.
+    """
+    delete_query = EmissionRollup.query
+    if user_id is not None:
+        delete_query = delete_query.filter_by(user_id=user_id)
+    delete_query.delete(synchronize_session=False)
+
+    daily = with_archived(DAILY_COLUMNS,
+                          lambda c: (c.user_id == user_id,) if user_id is not None else (),
+                          archive_cutoff()).subquery()
+    query = db.session.execute(select(daily).order_by(daily.c.user_id, daily.c.date),
+                               execution_options={'yield_per': REBUILD_BATCH_SIZE})
+
+    pending = []
+    current_user_id = None
+    periods = {}
+    users = 0
+
+    for row_user_id, day, *values in query:
+        if row_user_id != current_user_id:
+            pending.extend(periods.values())
+            periods = {}
+            current_user_id = row_user_id
+            users += 1
+            if len(pending) >= REBUILD_BATCH_SIZE:
+                upsert_rollups(pending)
+                pending = []
+
+        values = dict(zip(ROLLUP_SUM_COLUMNS, (value or 0.0 for value in values)))
+        for period in PERIODS:
+            start = period_start(period, day)
+            rollup = periods.get((period, start))
+            if rollup is None:
+                rollup = periods[(period, start)] = _rollup_row(row_user_id, period, start)
+            for col, value in values.items():
+                rollup[col] += value
+            rollup['entry_count'] += 1
+            total = values['total_emissions']
+            rollup['min_total'] = total if rollup['min_total'] is None else min(rollup['min_total'], total)
+            rollup['max_total'] = total if rollup['max_total'] is None else max(rollup['max_total'], total)
+
+    pending.extend(periods.values())
+    upsert_rollups(pending)
+    rebuild_cohort_sketches()
+    db.session.commit()
+
+    logging.info(f"Rebuilt rollups for {users} users")
+    return users
@@ -0,0 +1,67 @@
+import logging
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+
+# Pool settings for on-disk databases under the production profile. Connections are
+# kept open rather than recycled, so each keeps its page cache and memory map warm;
+# SQLite admits one writer at a time, so a larger pool would only add waiters.
+SQLITE_ENGINE_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 5,
+    'pool_timeout': 30,
+}
+
+def is_sqlite_file_url(url):
+    """Whether a database URL points at an on-disk SQLite database"""
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def sqlite_pragmas(config):
+    """Return the pragmas set on each new connection for the configured SQLITE_PROFILE
+
+    'production' enables WAL journaling, so readers keep going while a write
+    commits, with synchronous=NORMAL (durable across application crashes in WAL
+    mode), a busy timeout so writers queue for the lock instead of failing with
+    "database is locked", and a larger memory map and page cache (negative
+    cache_size is in KiB). Any other profile keeps SQLite's defaults.
+    """
+    if config.get('SQLITE_PROFILE') != 'production':
+        return {}
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(config['SQLITE_BUSY_TIMEOUT']),
+        'mmap_size': int(config['SQLITE_MMAP_SIZE']),
+        'cache_size': int(config['SQLITE_CACHE_SIZE']),
+    }
+
+def configure_sqlite(app):
+    """Default the engine options of an on-disk SQLite database (before db.init_app)"""
+    if app.config.get('SQLITE_PROFILE') != 'production':
+        return
+    if is_sqlite_file_url(app.config['SQLALCHEMY_DATABASE_URI']):
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', dict(SQLITE_ENGINE_OPTIONS))
+
+def _pragma_setter(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+def init_sqlite_profile(app):
+    """Set the profile's pragmas on every new connection of the app's SQLite engines"""
+    pragmas = sqlite_pragmas(app.config)
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite':
+                continue
+            event.listen(engine, 'connect', _pragma_setter(pragmas))
+            logging.debug(f"SQLite pragmas for {engine.url}: {pragmas}")
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The application modules are imported by file name, as main.py does
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+@pytest.fixture
+def app(tmp_path):
+    """An app on a fresh SQLite file (with its archive file next to it) and the schema created"""
+    from app import create_app, init_db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'carbon.db'}",
+        'METRICS_ENABLED': False,
+    })
+    with app.app_context():
+        init_db()
+        yield app
+
+@pytest.fixture
+def user_id(app):
+    """Id of a stored user that emission rows can belong to"""
+    from models import db, User
+
+    user = User(username='alice', email='alice@example.com', password_hash='unused')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
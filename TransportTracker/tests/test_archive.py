@@ -0,0 +1,88 @@
+"""Moving old emission rows into the attached SQLite archive and back"""
+from datetime import date
+
+from sqlalchemy import select
+
+from app import get_factor_tables
+from archive import _copy_batch, _delete_copied, archive_emissions, emissions_archive
+from batch_calculator import calculate_batch
+from emission_store import upsert_emissions
+from exports import iter_user_emissions
+from models import db, Emission, EmissionAppliance, EmissionTransport
+
+OLD_DAYS = [date(2023, 1, 5), date(2023, 2, 10), date(2023, 3, 15)]
+RECENT_DAY = date(2025, 6, 1)
+CUTOFF = date(2024, 1, 1)
+
+def _save_days(user_id, days, gas_usage=1):
+    records = [{'user_id': user_id, 'date': day.isoformat(), 'gas_usage': gas_usage,
+                'transport': [{'vehicle': 'Car', 'fuel': 'Petrol', 'distance': 10}],
+                'appliances': [{'appliance': 'TV', 'hours': 2}]} for day in days]
+    upsert_emissions(calculate_batch(records, get_factor_tables()))
+    db.session.commit()
+
+def _hot_days():
+    return sorted(db.session.execute(select(Emission.date)).scalars())
+
+def _archived_days():
+    return sorted(db.session.execute(select(emissions_archive.c.date)).scalars())
+
+def _exported(user_id):
+    return {entry['date']: entry for entry in iter_user_emissions(user_id)}
+
+def test_archive_moves_old_days_with_their_child_rows(app, user_id):
+    _save_days(user_id, OLD_DAYS + [RECENT_DAY])
+    before = _exported(user_id)
+
+    assert archive_emissions(CUTOFF, batch_size=2) == len(OLD_DAYS)
+
+    assert _hot_days() == [RECENT_DAY]
+    assert _archived_days() == OLD_DAYS
+    assert db.session.query(EmissionAppliance).count() == 1
+    assert db.session.query(EmissionTransport).count() == 1
+    archived = db.session.execute(select(emissions_archive)).mappings().first()
+    assert archived['appliance_usage'] == [{'appliance': 'TV', 'hours': 2.0}]
+    assert archived['transport_legs'] == [{'vehicle': 'Car', 'fuel': 'Petrol', 'distance': 10.0}]
+    assert _exported(user_id) == before
+
+def test_interrupted_move_keeps_one_copy_and_finishes_on_the_next_run(app, user_id):
+    _save_days(user_id, OLD_DAYS)
+    before = _exported(user_id)
+    archive_emissions(CUTOFF)
+    _save_days(user_id, OLD_DAYS[:1])
+    emission_ids = list(db.session.execute(select(Emission.id)).scalars())
+
+    # Copied but not yet deleted: the day is in both tables and read once
+    _copy_batch(emission_ids)
+    db.session.commit()
+    assert _hot_days() == OLD_DAYS[:1]
+    assert list(_exported(user_id)) == list(before)
+
+    assert archive_emissions(CUTOFF) == 1
+    assert _hot_days() == []
+    assert _archived_days() == OLD_DAYS
+
+def test_resaving_an_archived_day_moves_it_back(app, user_id):
+    _save_days(user_id, OLD_DAYS)
+    archive_emissions(CUTOFF)
+
+    _save_days(user_id, OLD_DAYS[:1], gas_usage=5)
+
+    assert _hot_days() == OLD_DAYS[:1]
+    assert _archived_days() == OLD_DAYS[1:]
+    assert _exported(user_id)[OLD_DAYS[0]]['gas_usage'] == 5
+
+def test_day_resaved_between_copy_and_delete_stays_hot(app, user_id):
+    _save_days(user_id, OLD_DAYS)
+    archive_emissions(CUTOFF)
+    _save_days(user_id, OLD_DAYS[:1])
+    emission_ids = list(db.session.execute(select(Emission.id)).scalars())
+    _copy_batch(emission_ids)
+    db.session.commit()
+
+    _save_days(user_id, OLD_DAYS[:1], gas_usage=5)
+    assert _delete_copied(emission_ids) == 0
+    db.session.commit()
+
+    assert _hot_days() == OLD_DAYS[:1]
+    assert _exported(user_id)[OLD_DAYS[0]]['gas_usage'] == 5
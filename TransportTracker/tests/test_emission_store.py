@@ -0,0 +1,25 @@
+"""Schema upgrades of the emissions table"""
+from datetime import date
+
+from sqlalchemy import inspect, insert, select, text
+
+from emission_store import UNIQUE_DAY_INDEX, ensure_unique_day_index
+from models import db, Emission
+
+def test_unique_day_index_upgrade_keeps_the_latest_row_of_each_day(app, user_id):
+    # A database from before the index, holding duplicates from the old read-then-write path
+    db.session.execute(text(f'DROP INDEX {UNIQUE_DAY_INDEX}'))
+    db.session.execute(insert(Emission), [
+        {'user_id': user_id, 'date': date(2024, 1, 1), 'total_emissions': 1.0},
+        {'user_id': user_id, 'date': date(2024, 1, 1), 'total_emissions': 2.0},
+        {'user_id': user_id, 'date': date(2024, 1, 2), 'total_emissions': 3.0},
+        {'user_id': user_id, 'date': date(2024, 1, 1), 'total_emissions': 4.0},
+    ])
+    db.session.commit()
+
+    ensure_unique_day_index()
+
+    rows = db.session.execute(select(Emission.date, Emission.total_emissions).order_by(Emission.date)).all()
+    assert [tuple(row) for row in rows] == [(date(2024, 1, 1), 4.0), (date(2024, 1, 2), 3.0)]
+    indexes = {index['name']: index for index in inspect(db.engine).get_indexes(Emission.__tablename__)}
+    assert indexes[UNIQUE_DAY_INDEX]['unique']
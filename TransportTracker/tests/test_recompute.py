@@ -0,0 +1,81 @@
+"""Checkpointed recomputation of stored totals from raw inputs"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app import emission_factors, get_factor_tables
+from batch_calculator import calculate_batch
+from emission_store import upsert_emissions
+from models import db, Emission, JobCheckpoint
+from recompute import RECOMPUTE_STALE_JOB, read_chunk, recompute_chunk, recompute_emissions, write_chunk
+
+DAYS = [date(2024, 5, 1) + timedelta(days=n) for n in range(5)]
+
+class Interrupted(Exception):
+    pass
+
+def _save_days(user_id, days, gas_usage=2):
+    records = [{'user_id': user_id, 'date': day.isoformat(), 'gas_usage': gas_usage} for day in days]
+    upsert_emissions(calculate_batch(records, get_factor_tables()))
+    db.session.commit()
+
+def _make_stale(days):
+    """Give rows an older factor version and totals that no longer match their inputs"""
+    db.session.execute(update(Emission).where(Emission.date.in_(days))
+                       .values(factor_version='old', gas_total=0.0, total_emissions=0.0))
+    db.session.commit()
+
+def _totals():
+    return dict(db.session.execute(select(Emission.date, Emission.total_emissions)).all())
+
+@pytest.fixture
+def stale_days(app, user_id):
+    _save_days(user_id, DAYS)
+    expected = _totals()
+    _make_stale(DAYS)
+    return expected
+
+def test_recompute_restores_totals_and_clears_the_checkpoint(stale_days):
+    factor_set = emission_factors.current()
+
+    assert recompute_emissions(factor_set, chunk_size=2) == (len(DAYS), len(DAYS), 0)
+
+    assert _totals() == stale_days
+    assert set(db.session.execute(select(Emission.factor_version)).scalars()) == {factor_set.version}
+    assert db.session.get(JobCheckpoint, RECOMPUTE_STALE_JOB) is None
+
+def test_interrupted_recompute_resumes_after_the_last_written_chunk(stale_days):
+    factor_set = emission_factors.current()
+
+    def interrupt(read, updated, skipped):
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        recompute_emissions(factor_set, chunk_size=2, progress=interrupt)
+    db.session.rollback()
+    checkpoint = db.session.get(JobCheckpoint, RECOMPUTE_STALE_JOB)
+    first_ids = sorted(db.session.execute(select(Emission.id)).scalars())[:2]
+    assert checkpoint.last_id == first_ids[-1]
+    assert checkpoint.factor_version == factor_set.version
+
+    # Mark the written chunk stale again: a resumed run must not revisit it
+    _make_stale(DAYS[:2])
+    assert recompute_emissions(factor_set, chunk_size=2) == (3, 3, 0)
+    assert {day for day, total in _totals().items() if total != stale_days[day]} == set(DAYS[:2])
+
+def test_write_back_skips_rows_changed_after_they_were_read(user_id, stale_days):
+    factor_set = emission_factors.current()
+    chunk = read_chunk(0, 10, factor_set.version, False)
+    db.session.rollback()
+    updates, skipped = recompute_chunk(chunk, factor_set.tables)
+    assert (len(updates), skipped) == (len(DAYS), 0)
+
+    # Live traffic re-saves one day while the chunk is being calculated
+    _save_days(user_id, DAYS[:1], gas_usage=7)
+    resaved = _totals()[DAYS[0]]
+    write_chunk(updates, RECOMPUTE_STALE_JOB, chunk[-1]['id'], factor_set.version)
+
+    totals = _totals()
+    assert totals[DAYS[0]] == resaved != stale_days[DAYS[0]]
+    assert all(totals[day] == stale_days[day] for day in DAYS[1:])
@@ -0,0 +1,70 @@
+"""Read/write routing against two SQLite files standing in for a primary and a replica"""
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import create_app, init_db
+from models import db, Emission, User
+from replicas import STICKY_PRIMARY_KEY
+
+# Only the replica has this day, so reading it back proves a query went to the replica
+REPLICA_ONLY_DAY = date(2020, 1, 1)
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'DATABASE_REPLICA_URLS': f"sqlite:///{tmp_path / 'replica.db'}",
+        'REPLICA_STICKY_SECONDS': 30,
+        'METRICS_ENABLED': False,
+    })
+    with app.app_context():
+        init_db()
+        db.metadata.create_all(db.engines['replica_0'])
+    return app
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/signup', data={'username': 'alice', 'email': 'alice@example.com', 'password': 'secret'})
+    with app.app_context():
+        user = db.session.execute(select(User.__table__)).mappings().one()
+        with db.engines['replica_0'].begin() as connection:
+            connection.execute(insert(User.__table__), dict(user))
+            connection.execute(insert(Emission.__table__), {'user_id': user['id'], 'date': REPLICA_ONLY_DAY,
+                                                            'total_emissions': 1.0})
+    _expire_sticky(client)
+    return client
+
+def _expire_sticky(client):
+    with client.session_transaction() as session:
+        session.pop(STICKY_PRIMARY_KEY, None)
+
+def _exported_days(client):
+    response = client.get('/history/export.ndjson')
+    assert response.status_code == 200
+    return [json.loads(line)['date'] for line in response.get_data(as_text=True).splitlines()]
+
+def _stored_days(app, bind_key):
+    with app.app_context():
+        with db.engines[bind_key].connect() as connection:
+            return [str(day) for day in connection.execute(select(Emission.date)).scalars()]
+
+def test_read_replica_routes_read_from_the_replica(client):
+    assert _exported_days(client) == [str(REPLICA_ONLY_DAY)]
+
+def test_writes_go_to_the_primary(app, client):
+    response = client.post('/api/calculate', json={'date': '2024-03-01', 'gas_usage': 1})
+    assert response.status_code == 200
+
+    assert _stored_days(app, None) == ['2024-03-01']
+    assert _stored_days(app, 'replica_0') == [str(REPLICA_ONLY_DAY)]
+
+def test_reads_after_a_write_stay_on_the_primary(client):
+    client.post('/api/calculate', json={'date': '2024-03-01', 'gas_usage': 1})
+    assert _exported_days(client) == ['2024-03-01']
+
+    _expire_sticky(client)
+    assert _exported_days(client) == [str(REPLICA_ONLY_DAY)]
@@ -0,0 +1,170 @@
+from datetime import timedelta
+from sqlalchemy import func, select
+from models import db, Emission, EmissionRollup
+from history_engine import HISTORY_COLUMNS
+from archive import archive_cutoff, emissions_archive, with_archived
+from cache import TTLCache
+
+# Series keys, in the order of HISTORY_COLUMNS after the date
+TREND_SERIES = ('total', 'transportation', 'electricity', 'diet', 'gas', 'waste', 'water')
+
+# Rolling average window lengths in calendar days
+ROLLING_WINDOWS = (7, 30)
+
+# Days of rolling averages returned by default and at most
+TRENDS_DEFAULT_DAYS = 90
+TRENDS_MAX_DAYS = 365
+
+# Forecast horizon in days and the history it is fitted on
+FORECAST_DAYS = 7
+FORECAST_FIT_DAYS = 30
+
+# Smoothing factor for the exponential smoothing forecast
+SMOOTHING_ALPHA = 0.3
+
+# Full trend payloads by user id, each stored with the trends_version() it was computed at
+trends_cache = TTLCache()
+
+def _load_calendar(user_id, np):
+    """Load a user's recent entries onto a daily calendar ending at their latest entry
+
+    Returns (start date, values, logged) where values has one row per calendar day
+    and one column per TREND_SERIES key, and logged marks days that have an entry.
+    """
+    last_day = db.session.query(func.max(Emission.date)).filter(Emission.user_id == user_id).scalar()
+    cutoff = archive_cutoff()
+    if cutoff is not None and (last_day is None or last_day < cutoff):
+        # Users without recent entries may only have archived days
+        archived_last = db.session.query(func.max(emissions_archive.c.date))\
+                                  .filter(emissions_archive.c.user_id == user_id).scalar()
+        last_day = max((day for day in (last_day, archived_last) if day is not None), default=None)
+    if last_day is None:
+        return None, None, None
+
+    start = last_day - timedelta(days=TRENDS_MAX_DAYS + max(ROLLING_WINDOWS) - 2)
+    if cutoff is not None and start < cutoff:
+        stmt = with_archived([col.key for col in HISTORY_COLUMNS],
+                             lambda c: (c.user_id == user_id, c.date >= start), cutoff).subquery()
+        rows = db.session.execute(select(stmt).order_by(stmt.c.date.asc())).all()
+    else:
+        rows = db.session.query(*HISTORY_COLUMNS)\
+                         .filter(Emission.user_id == user_id, Emission.date >= start)\
+                         .order_by(Emission.date.asc()).all()
+
+    offsets = np.fromiter(((row.date - start).days for row in rows), dtype=np.int64, count=len(rows))
+    data = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(TREND_SERIES))
+
+    days = (last_day - start).days + 1
+    values = np.zeros((days, len(TREND_SERIES)))
+    logged = np.zeros(days)
+    values[offsets] = np.nan_to_num(data)
+    logged[offsets] = 1
+    return start, values, logged
+
+def _window_sums(array, window, np):
+    """Sum of each trailing `window`-day span along the first axis, shorter at the start"""
+    cumulative = np.concatenate([np.zeros((1,) + array.shape[1:]), np.cumsum(array, axis=0)])
+    ends = np.arange(1, len(array) + 1)
+    return cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+def _to_list(array):
+    """Round to 2 decimals and convert NaN to None for JSON"""
+    return [None if value != value else value for value in array.round(2).tolist()]
+
+def _smoothed_level(series, np):
+    """Final level of simple exponential smoothing, computed as one weighted sum"""
+    n = len(series)
+    weights = SMOOTHING_ALPHA * (1 - SMOOTHING_ALPHA) ** np.arange(n - 1, -1, -1)
+    weights[0] = (1 - SMOOTHING_ALPHA) ** (n - 1)
+    return float(weights @ series)
+
+def compute_trends(user_id):
+    """Compute rolling averages, week-over-week changes and a forecast of daily totals
+
+    Rolling averages and weekly changes average over logged days only, so days
+    without an entry neither count as zero nor break the series.
+    """
+    import numpy as np
+
+    start, values, logged = _load_calendar(user_id, np)
+    if start is None:
+        return {'as_of': None, 'dates': [], 'rolling': {}, 'week_over_week': {},
+                'forecast': {'dates': [], 'linear': [], 'smoothed': []}}
+
+    days = len(logged)
+    last_day = start + timedelta(days=days - 1)
+    shown = min(days, TRENDS_MAX_DAYS)
+    dates = [(last_day - timedelta(days=offset)).isoformat() for offset in range(shown - 1, -1, -1)]
+
+    # Trailing window averages for every day and series in one pass per window
+    rolling = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for window in ROLLING_WINDOWS:
+            averages = _window_sums(values, window, np) / _window_sums(logged, window, np)[:, None]
+            rolling[str(window)] = {key: _to_list(averages[-shown:, i]) for i, key in enumerate(TREND_SERIES)}
+
+    # This week against the 7 days before it
+    week_sums = _window_sums(values, 7, np)
+    week_counts = _window_sums(logged, 7, np)
+    current = week_sums[-1] / week_counts[-1] if week_counts[-1] else np.full(len(TREND_SERIES), np.nan)
+    previous = week_sums[-8] / week_counts[-8] if days > 7 and week_counts[-8] else np.full(len(TREND_SERIES), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = current - previous
+        pct_change = np.where(previous > 0, delta / previous * 100, np.nan)
+    week_over_week = {
+        key: {'current': current_value, 'previous': previous_value, 'delta': delta_value, 'pct_change': pct_value}
+        for key, current_value, previous_value, delta_value, pct_value
+        in zip(TREND_SERIES, _to_list(current), _to_list(previous), _to_list(delta), _to_list(pct_change))
+    }
+
+    # Forecast daily totals from the logged days in the fitting window
+    fit_offsets = np.flatnonzero(logged[-FORECAST_FIT_DAYS:]) + max(days - FORECAST_FIT_DAYS, 0)
+    fit_totals = values[fit_offsets, 0]
+    future = np.arange(days, days + FORECAST_DAYS)
+    if len(fit_offsets) >= 2:
+        slope, intercept = np.polyfit(fit_offsets, fit_totals, 1)
+        linear = np.maximum(slope * future + intercept, 0)
+    else:
+        linear = np.full(FORECAST_DAYS, fit_totals[-1] if len(fit_totals) else np.nan)
+    smoothed = np.full(FORECAST_DAYS, _smoothed_level(fit_totals, np) if len(fit_totals) else np.nan)
+
+    return {
+        'as_of': last_day.isoformat(),
+        'dates': dates,
+        'rolling': rolling,
+        'week_over_week': week_over_week,
+        'forecast': {
+            'dates': [(last_day + timedelta(days=offset)).isoformat() for offset in range(1, FORECAST_DAYS + 1)],
+            'linear': _to_list(linear),
+            'smoothed': _to_list(smoothed),
+        },
+    }
+
+def trends_version(user_id):
+    """Time the user's rollups last changed
+
+    Every path that writes emission rows refreshes the rollups of the days it
+    wrote, in the same transaction, so this moves whenever the trend input does.
+    """
+    return db.session.query(func.max(EmissionRollup.updated_at))\
+                     .filter(EmissionRollup.user_id == user_id, EmissionRollup.period == 'month').scalar()
+
+def get_trends(user_id, days=TRENDS_DEFAULT_DAYS):
+    """Return the cached trend payload for a user, trimmed to the last `days` days
+
+    A cached payload is only used while the user's rollups are unchanged, so
+    writes made by any worker or job are seen on the next request.
+    """
+    version = trends_version(user_id)
+    cached = trends_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        trends = cached[1]
+    else:
+        trends = compute_trends(user_id)
+        trends_cache.put(user_id, (version, trends))
+
+    days = max(1, min(days, TRENDS_MAX_DAYS))
+    return dict(trends,
+                dates=trends['dates'][-days:],
+                rolling={window: {key: series[-days:] for key, series in by_key.items()}
+                         for window, by_key in trends['rolling'].items()})
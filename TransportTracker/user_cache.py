@@ -0,0 +1,43 @@
+from flask_login import UserMixin
+from sqlalchemy import event
+from models import db, User
+from cache import TTLCache
+
+class UserIdentity(UserMixin):
+    """Lightweight stand-in for User used as current_user
+
+    Holds only the columns request handlers and templates need. Call
+    get_user() when a route needs the full ORM object or its relationships.
+    """
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    def get_user(self):
+        """Load the full User row for this identity"""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+# Identities by user id; dropped on local updates via the listeners below
+user_cache = TTLCache()
+
+def load_identity(user_id):
+    """Return the cached identity for a user id, querying only identity columns on a miss"""
+    identity = user_cache.get(user_id)
+    if identity is None:
+        row = db.session.query(User.id, User.username, User.email).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        identity = UserIdentity(*row)
+        user_cache.put(identity.id, identity)
+    return identity
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    # Password or profile changes must not be served from a stale identity
+    user_cache.invalidate(target.id)
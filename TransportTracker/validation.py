@@ -0,0 +1,18 @@
+# Largest accepted numeric input; keeps every calculated total finite
+MAX_INPUT_NUMBER = 1e6
+
+# Error text for numeric inputs that fail input_number()
+NUMBER_RULE = f"must be a number from 0 to {MAX_INPUT_NUMBER:g}"
+
+def input_number(value):
+    """Return a numeric input as a float, 0.0 when missing, or None when it is invalid
+
+    Shared by /api/calculate and bulk records: JSON numbers only (not booleans),
+    finite and between 0 and MAX_INPUT_NUMBER.
+    """
+    if value is None:
+        return 0.0
+    # Exact types exclude bool; NaN and infinities fail the range comparison
+    if type(value) not in (int, float) or not 0 <= value <= MAX_INPUT_NUMBER:
+        return None
+    return float(value)